@@ -1,16 +1,29 @@
 """
 Agents module - Multi-agent architecture for risk intelligence
+
+Agents are imported lazily on first access so that importing one agent
+does not pull in the heavy dependencies (torch, transformers, FAISS) of
+the others.
 """
-from backend.agents.market_agent import MarketDataAgent
-from backend.agents.sentiment_agent import SentimentAgent
-from backend.agents.rag_agent import NewsRAGAgent
-from backend.agents.risk_agent import RiskScoringAgent
-from backend.agents.alert_agent import AlertAgent
+import importlib
+
+_LAZY_AGENTS = {
+    'MarketDataAgent': 'backend.agents.market_agent',
+    'SentimentAgent': 'backend.agents.sentiment_agent',
+    'NewsRAGAgent': 'backend.agents.rag_agent',
+    'RiskScoringAgent': 'backend.agents.risk_agent',
+    'AlertAgent': 'backend.agents.alert_agent',
+}
+
+__all__ = list(_LAZY_AGENTS)
+
+def __getattr__(name):
+    if name in _LAZY_AGENTS:
+        module = importlib.import_module(_LAZY_AGENTS[name])
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-__all__ = [
-    'MarketDataAgent',
-    'SentimentAgent',
-    'NewsRAGAgent',
-    'RiskScoringAgent',
-    'AlertAgent'
-]
\ No newline at end of file
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -2,11 +2,49 @@
 Alert Agent - Monitor risk scores and generate alerts
 Now using PostgreSQL for data persistence
 """
+import hashlib
 from typing import List, Dict
+import numpy as np
 from datetime import datetime, timedelta
-from backend.utils import log, load_config
+from backend.utils import log, load_config, TTLCache
 from backend.database import DatabaseService
-from backend.agents.rag_agent import NewsRAGAgent
+
+SEPARATOR = "-" * 60
+
+# Default alert thresholds
+HIGH_RISK_THRESHOLD = 0.6
+SPIKE_PCT_THRESHOLD = 0.2       # 20% increase
+SPIKE_ABSOLUTE_THRESHOLD = 0.15  # Absolute increase
+SPIKE_HIGH_SEVERITY_PCT = 50.0   # Spikes at or above this % change are HIGH severity
+
+# RAG explanations shared across AlertAgent instances in this process
+_explanation_cache = TTLCache(maxsize=1000, ttl=15 * 60)
+
+def _explanation_cache_key(symbol: str, alert_type: str, query: str) -> str:
+    """Build a compact cache key for a RAG explanation"""
+    return hashlib.blake2b(
+        f"{symbol}|{alert_type}|{query}".encode(), digest_size=16
+    ).hexdigest()
+
+def _spike_kernel(current_risk: np.ndarray, prev_risk: np.ndarray,
+                  abs_threshold: float, pct_threshold: float):
+    """
+    Numeric core of spike detection on plain float arrays
+    
+    Returns:
+        Tuple of (spike indices, risk change, risk change %) where the
+        change arrays cover every input row
+    """
+    risk_change = current_risk - prev_risk
+    with np.errstate(divide='ignore', invalid='ignore'):
+        risk_change_pct = np.where(prev_risk > 0, risk_change / prev_risk * 100, 0.0)
+    
+    spike_idx = np.flatnonzero(np.logical_or(
+        risk_change > abs_threshold,
+        risk_change_pct > pct_threshold
+    ))
+    
+    return spike_idx, risk_change, risk_change_pct
 
 class AlertAgent:
     """
@@ -16,95 +54,103 @@ class AlertAgent:
     def __init__(self):
         self.config = load_config()
         self.alert_thresholds = {
-            'high_risk': 0.6,
-            'spike_threshold': 0.2,  # 20% increase
-            'spike_absolute': 0.15   # Absolute increase
+            'high_risk': HIGH_RISK_THRESHOLD,
+            'spike_threshold': SPIKE_PCT_THRESHOLD,
+            'spike_absolute': SPIKE_ABSOLUTE_THRESHOLD
         }
         self.rag_agent = None
     
     def load_rag_agent(self):
-        """Load RAG agent for explanations (lazy loading)"""
+        """Load RAG agent for explanations (lazy loading, shared per process)"""
         if self.rag_agent is None:
-            try:
-                log.info("Loading RAG agent for alert explanations...")
-                self.rag_agent = NewsRAGAgent()
-                self.rag_agent.vector_store = self.rag_agent.load_vector_store()
-                if self.rag_agent.vector_store:
-                    log.info("✓ RAG agent loaded successfully")
-                else:
-                    log.warning("RAG vector store not found, alerts will have basic explanations")
-            except Exception as e:
-                log.error(f"Failed to load RAG agent: {str(e)}")
-                self.rag_agent = None
+            log.info("Loading RAG agent for alert explanations...")
+            from backend.agents.rag_agent import get_shared_rag_agent
+            self.rag_agent = get_shared_rag_agent()
+            
+            if self.rag_agent is None:
+                return
+            
+            if self.rag_agent.vector_store:
+                log.info("✓ RAG agent loaded successfully")
+            else:
+                log.warning("RAG vector store not found, alerts will have basic explanations")
     
     def detect_high_risk_stocks(self, risk_scores_df) -> List[Dict]:
         """Detect stocks with high risk levels"""
-        alerts = []
-        
-        high_risk_stocks = risk_scores_df[
-            risk_scores_df['risk_level'] == 'High'
+        high_risk_stocks = risk_scores_df.loc[
+            risk_scores_df['risk_level'] == 'High',
+            ['symbol', 'risk_score', 'risk_level', 'risk_drivers']
         ]
         
-        for _, stock in high_risk_stocks.iterrows():
-            alert = {
-                'symbol': stock['symbol'],
+        timestamp = datetime.utcnow()
+        
+        return [
+            {
+                **stock,
                 'alert_type': 'high_risk',
                 'severity': 'HIGH',
-                'risk_score': stock['risk_score'],
                 'prev_risk_score': None,
                 'risk_change': None,
                 'risk_change_pct': None,
-                'risk_level': stock['risk_level'],
-                'risk_drivers': stock['risk_drivers'],
                 'explanation': None,
-                'timestamp': datetime.utcnow()
+                'timestamp': timestamp
             }
-            alerts.append(alert)
-        
-        return alerts
+            for stock in high_risk_stocks.to_dict('records')
+        ]
     
-    def detect_sudden_spikes(self, current_scores_df, historical_scores_df) -> List[Dict]:
-        """Detect sudden spikes in risk scores"""
-        alerts = []
+    def detect_sudden_spikes(self, current_scores_df, historical_avg_df) -> List[Dict]:
+        """
+        Detect sudden spikes in risk scores
         
-        if historical_scores_df.empty:
+        Args:
+            current_scores_df: Latest risk scores
+            historical_avg_df: Average historical risk per stock
+                (columns: symbol, prev_risk_score)
+        """
+        if historical_avg_df.empty:
             log.warning("No historical data available for spike detection")
-            return alerts
+            return []
         
-        # Get average historical risk for each stock
-        historical_avg = historical_scores_df.groupby('symbol')['risk_score'].mean().to_dict()
-        
-        for _, stock in current_scores_df.iterrows():
-            symbol = stock['symbol']
-            current_risk = stock['risk_score']
-            
-            if symbol not in historical_avg:
-                continue
-            
-            prev_risk = historical_avg[symbol]
-            risk_change = current_risk - prev_risk
-            risk_change_pct = (risk_change / prev_risk * 100) if prev_risk > 0 else 0
-            
-            # Check if spike exceeds threshold
-            if risk_change > self.alert_thresholds['spike_absolute'] or \
-               risk_change_pct > self.alert_thresholds['spike_threshold'] * 100:
-                
-                alert = {
-                    'symbol': symbol,
-                    'alert_type': 'sudden_spike',
-                    'severity': 'MEDIUM',
-                    'risk_score': current_risk,
-                    'prev_risk_score': prev_risk,
-                    'risk_change': risk_change,
-                    'risk_change_pct': risk_change_pct,
-                    'risk_level': stock['risk_level'],
-                    'risk_drivers': stock['risk_drivers'],
-                    'explanation': None,
-                    'timestamp': datetime.utcnow()
-                }
-                alerts.append(alert)
+        # Inner join drops stocks without history, preserving current order
+        merged = current_scores_df.merge(
+            historical_avg_df[['symbol', 'prev_risk_score']], on='symbol', how='inner'
+        )
         
-        return alerts
+        # Check if spike exceeds threshold
+        spike_idx, risk_change, risk_change_pct = _spike_kernel(
+            merged['risk_score'].to_numpy(dtype=float),
+            merged['prev_risk_score'].to_numpy(dtype=float),
+            self.alert_thresholds['spike_absolute'],
+            self.alert_thresholds['spike_threshold'] * 100
+        )
+        
+        # Slice rows first so only the spiking stocks are materialized
+        spikes = merged.iloc[spike_idx][
+            ['symbol', 'risk_score', 'prev_risk_score', 'risk_level', 'risk_drivers']
+        ]
+        
+        spike_change_pct = risk_change_pct[spike_idx]
+        severity = np.where(spike_change_pct < SPIKE_HIGH_SEVERITY_PCT, 'MEDIUM', 'HIGH')
+        
+        timestamp = datetime.utcnow()
+        
+        return [
+            {
+                **stock,
+                'alert_type': 'sudden_spike',
+                'severity': level,
+                'risk_change': change,
+                'risk_change_pct': change_pct,
+                'explanation': None,
+                'timestamp': timestamp
+            }
+            for stock, level, change, change_pct in zip(
+                spikes.to_dict('records'),
+                severity.tolist(),
+                risk_change[spike_idx].tolist(),
+                spike_change_pct.tolist()
+            )
+        ]
     
     def generate_explanations(self, alerts: List[Dict]) -> List[Dict]:
         """Generate RAG-based explanations for alerts"""
@@ -116,23 +162,66 @@ class AlertAgent:
         
         log.info(f"Generating explanations for {len(alerts)} alerts...")
         
+        # Resolve cached explanations; group the rest by query so each
+        # distinct query is sent to the RAG agent only once
+        pending = {}
         for alert in alerts:
-            try:
-                query = f"Why is {alert['symbol']} showing {alert['alert_type']}? Risk drivers: {alert['risk_drivers']}"
-                
-                result = self.rag_agent.generate_explanation(
-                    query=query,
-                    stock_symbol=alert['symbol']
-                )
-                
-                alert['explanation'] = result.get('explanation', alert['risk_drivers'])
-                
-            except Exception as e:
-                log.error(f"Failed to generate explanation for {alert['symbol']}: {str(e)}")
-                alert['explanation'] = alert['risk_drivers']
+            query = f"Why is {alert['symbol']} showing {alert['alert_type']}? Risk drivers: {alert['risk_drivers']}"
+            cache_key = _explanation_cache_key(alert['symbol'], alert['alert_type'], query)
+            
+            explanation = _explanation_cache.get(cache_key)
+            if explanation is not None:
+                alert['explanation'] = explanation
+            elif cache_key in pending:
+                pending[cache_key][2].append(alert)
+            else:
+                pending[cache_key] = (query, alert['symbol'], [alert])
+        
+        if not pending:
+            return alerts
+        
+        log.info(f"Requesting {len(pending)} unique explanations from RAG agent")
+        
+        try:
+            results = self.rag_agent.generate_explanation_batch(
+                queries=[query for query, _, _ in pending.values()],
+                stock_symbols=[symbol for _, symbol, _ in pending.values()]
+            )
+        except Exception as e:
+            log.error(f"Failed to generate explanations: {str(e)}")
+            results = [{} for _ in pending]
+        
+        for (cache_key, (_, _, group)), result in zip(pending.items(), results):
+            explanation = result.get('explanation')
+            if explanation is not None:
+                _explanation_cache.set(cache_key, explanation)
+            
+            for alert in group:
+                alert['explanation'] = explanation if explanation is not None else alert['risk_drivers']
         
         return alerts
     
+    def format_alert_message(self, alert: Dict) -> str:
+        """Format a single alert as a multi-line notification message"""
+        severity_icon = "🚨" if alert['severity'] == 'HIGH' else "⚠️"
+        
+        lines = [
+            f"{severity_icon} {alert['alert_type'].upper()}: {alert['symbol']}",
+            f"   Risk Score: {alert['risk_score']:.3f} ({alert['risk_level']})"
+        ]
+        
+        if alert['risk_change']:
+            lines.append(f"   Change: +{alert['risk_change']:.3f} ({alert['risk_change_pct']:.1f}%)")
+        
+        lines.append(f"   Drivers: {alert['risk_drivers']}")
+        
+        if alert['explanation']:
+            lines.append(f"   Explanation: {alert['explanation'][:100]}...")
+        
+        lines.append(SEPARATOR)
+        
+        return "\n".join(lines)
+    
     def send_notifications(self, alerts: List[Dict]):
         """Send alert notifications (console for now)"""
         if not alerts:
@@ -143,21 +232,9 @@ class AlertAgent:
         log.info(f"SENDING {len(alerts)} ALERT NOTIFICATIONS")
         log.info("=" * 60)
         
-        for alert in alerts:
-            severity_icon = "🚨" if alert['severity'] == 'HIGH' else "⚠️"
-            
-            log.info(f"{severity_icon} {alert['alert_type'].upper()}: {alert['symbol']}")
-            log.info(f"   Risk Score: {alert['risk_score']:.3f} ({alert['risk_level']})")
-            
-            if alert['risk_change']:
-                log.info(f"   Change: +{alert['risk_change']:.3f} ({alert['risk_change_pct']:.1f}%)")
-            
-            log.info(f"   Drivers: {alert['risk_drivers']}")
-            
-            if alert['explanation']:
-                log.info(f"   Explanation: {alert['explanation'][:100]}...")
-            
-            log.info("-" * 60)
+        # One buffered write for the whole batch instead of one per alert
+        messages = [self.format_alert_message(alert) for alert in alerts]
+        log.info("\n" + "\n".join(messages))
     
     def process(self):
         """
@@ -178,9 +255,9 @@ class AlertAgent:
             
             log.info(f"Loaded {len(current_scores)} current risk scores")
             
-            # Load historical risk scores
+            # Load historical risk averages (aggregated in the database)
             log.info("Loading historical risk scores...")
-            historical_scores = db.get_risk_history(days=30)
+            historical_avg = db.get_average_risk_history(days=30)
             
             # Detect high risk stocks
             log.info("Detecting high risk stocks...")
@@ -189,7 +266,7 @@ class AlertAgent:
             
             # Detect sudden spikes
             log.info("Detecting sudden risk spikes...")
-            spike_alerts = self.detect_sudden_spikes(current_scores, historical_scores)
+            spike_alerts = self.detect_sudden_spikes(current_scores, historical_avg)
             log.info(f"Found {len(spike_alerts)} spike alerts")
             
             # Combine all alerts
@@ -2,176 +2,270 @@
 Market Data Agent - Compute quantitative risk features from market data
 Now using PostgreSQL for data persistence
 """
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import numpy as np
 from backend.utils import log, load_config
 from backend.database import DatabaseService
 
+# Use pandas' numba rolling engine when numba is installed (optional speed-up)
+try:
+    import numba  # noqa: F401
+    ROLLING_ENGINE = {
+        'engine': 'numba',
+        'engine_kwargs': {'nopython': True, 'nogil': True, 'parallel': False}
+    }
+except ImportError:
+    ROLLING_ENGINE = {}
+
+# bottleneck's moving-window functions for simple per-symbol stats (optional)
+try:
+    import bottleneck as bn
+except ImportError:
+    bn = None
+
+# Symbols loaded and processed together; bounds the pipeline's peak memory
+SYMBOL_BATCH_SIZE = 100
+
+def _warmup_rolling_engine():
+    """
+    Compile the numba rolling kernels on a tiny frame
+    
+    pandas caches the compiled kernels per process, so the JIT cost is paid
+    here at import instead of on the first process() call.
+    """
+    if not ROLLING_ENGINE:
+        return
+    
+    sample = pd.DataFrame({
+        'symbol': pd.Categorical(['A'] * 10),
+        'value': np.arange(10, dtype=float)
+    })
+    rolling = sample.groupby('symbol', observed=True, sort=False)['value'].rolling(window=3, min_periods=1)
+    rolling.mean(**ROLLING_ENGINE)
+    rolling.std(**ROLLING_ENGINE)
+
+_warmup_rolling_engine()
+
+def _rolling_max_drawdown(prices: np.ndarray, window: int, min_periods: int) -> np.ndarray:
+    """
+    Max drawdown (%) of each trailing window of a single price series
+    
+    The peak is taken within the window, matching an expanding cummax
+    applied to every window.
+    """
+    n = len(prices)
+    out = np.full(n, np.nan)
+    
+    # Windows still filling up start at the first price
+    head = min(n, window - 1)
+    peaks = np.fmax.accumulate(prices[:head])
+    out[:head] = np.fmin.accumulate((prices[:head] - peaks) / peaks)
+    
+    # Full windows: cummax along each window, then the worst drawdown
+    if n >= window:
+        windows = np.lib.stride_tricks.sliding_window_view(prices, window)
+        peaks = np.fmax.accumulate(windows, axis=1)
+        out[window - 1:] = np.fmin.reduce((windows - peaks) / peaks, axis=1)
+    
+    # Require min_periods valid prices in the window
+    valid = np.concatenate(([0], np.cumsum(~np.isnan(prices))))
+    counts = valid[1:] - valid[np.maximum(np.arange(1, n + 1) - window, 0)]
+    out[counts < min_periods] = np.nan
+    
+    return out * 100  # As percentage
+
 class MarketDataAgent:
     """
     Agent responsible for computing market-based risk features
+    
+    The compute_* methods add their feature columns to the frame they are
+    given; compute_all_features works on its own sorted copy of the input.
     """
     
     def __init__(self):
         self.config = load_config()
         #self.features_config = self.config['features']
     
+    def _rolling(self, df: pd.DataFrame, column: str, window: int, min_periods: int):
+        """Per-symbol rolling window over a column (one grouped pass, no per-group lambda)"""
+        grouped = df.groupby('symbol', observed=True, sort=False)[column]
+        return grouped.rolling(window=window, min_periods=min_periods)
+    
+    def _align(self, rolled):
+        """Drop the symbol level grouped rolling adds (the numba engine omits it)"""
+        return rolled.droplevel(0) if rolled.index.nlevels > 1 else rolled
+    
+    def _rolling_stat(self, df: pd.DataFrame, column: str, window: int,
+                      min_periods: int, stat: str) -> pd.Series:
+        """Per-symbol rolling statistic aligned back to df's index"""
+        rolled = getattr(self._rolling(df, column, window, min_periods), stat)(**ROLLING_ENGINE)
+        return self._align(rolled)
+    
+    def _rolling_stats(self, df: pd.DataFrame, column: str, window: int,
+                       min_periods: int, stats: list) -> pd.DataFrame:
+        """Several per-symbol rolling statistics from one shared window pass"""
+        rolling = self._rolling(df, column, window, min_periods)
+        rolled = pd.concat(
+            {stat: getattr(rolling, stat)(**ROLLING_ENGINE) for stat in stats}, axis=1
+        )
+        return self._align(rolled)
+    
+    def _rolling_mean_std(self, df: pd.DataFrame, column: str, window: int,
+                          min_periods: int) -> tuple:
+        """Per-symbol rolling mean and std as arrays in df's row order"""
+        if bn is None:
+            rolling = self._rolling_stats(df, column, window, min_periods, stats=['mean', 'std'])
+            rolling = rolling.reindex(df.index)
+            return rolling['mean'].to_numpy(), rolling['std'].to_numpy()
+        
+        # One C call per symbol slice, no grouped rolling machinery
+        values = df[column].to_numpy(dtype=float)
+        mean = np.full(len(df), np.nan)
+        std = np.full(len(df), np.nan)
+        
+        for idx in df.groupby('symbol', observed=True, sort=False).indices.values():
+            mean[idx] = bn.move_mean(values[idx], window=window, min_count=min_periods)
+            std[idx] = bn.move_std(values[idx], window=window, min_count=min_periods, ddof=1)
+        
+        return mean, std
+    
     def compute_returns(self, df: pd.DataFrame) -> pd.DataFrame:
         """Compute daily returns"""
-        df = df.copy()
-        df['returns'] = df.groupby('symbol')['Close'].pct_change()
+        # Plain divide by the previous close (pct_change adds fill/coercion overhead)
+        close = df['Close'].to_numpy(dtype=float)
+        prev_close = df.groupby('symbol', observed=True, sort=False)['Close'].shift(1).to_numpy(dtype=float)
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            df['returns'] = close / prev_close - 1.0
         return df
     
     def compute_volatility(self, df: pd.DataFrame) -> pd.DataFrame:
         """Compute rolling volatility (annualized)"""
-        df = df.copy()
-        
         # 21-day volatility (approximately 1 month)
-        df['volatility_21d'] = df.groupby('symbol')['returns'].transform(
-            lambda x: x.rolling(window=21, min_periods=10).std() * np.sqrt(252)
-        )
+        df['volatility_21d'] = self._rolling_stat(df, 'returns', window=21, min_periods=10, stat='std') * np.sqrt(252)
         
         # 60-day volatility (approximately 3 months)
-        df['volatility_60d'] = df.groupby('symbol')['returns'].transform(
-            lambda x: x.rolling(window=60, min_periods=30).std() * np.sqrt(252)
-        )
+        df['volatility_60d'] = self._rolling_stat(df, 'returns', window=60, min_periods=30, stat='std') * np.sqrt(252)
         
         return df
     
     def compute_max_drawdown(self, df: pd.DataFrame, window: int = 252) -> pd.DataFrame:
         """Compute maximum drawdown over rolling window"""
-        df = df.copy()
-        
-        def max_dd(prices):
-            """Calculate max drawdown for a price series"""
-            if len(prices) < 2:
-                return 0
-            cummax = prices.expanding(min_periods=1).max()
-            drawdown = (prices - cummax) / cummax
-            return drawdown.min() * 100  # As percentage
-        
-        df['max_drawdown'] = df.groupby('symbol')['Close'].transform(
-            lambda x: x.rolling(window=window, min_periods=20).apply(max_dd, raw=False)
-        )
+        close = df['Close'].to_numpy(dtype=np.float32)
+        positions = list(df.groupby('symbol', observed=True, sort=False).indices.values())
+        
+        # One kernel call per symbol on its group positions
+        drawdown = np.full(len(df), np.nan)
+        for idx in positions:
+            drawdown[idx] = _rolling_max_drawdown(close[idx], window, 20)
+        
+        df['max_drawdown'] = drawdown
         
         return df
     
     def compute_beta(self, df: pd.DataFrame, benchmark_df: pd.DataFrame) -> pd.DataFrame:
         """Compute beta relative to benchmark (simplified)"""
-        df = df.copy()
-        
-        # Merge with benchmark
-        benchmark_df = benchmark_df.rename(columns={'Close': 'Benchmark_Close'})
-        df = df.merge(
-            benchmark_df[['Date', 'Benchmark_Close']], 
-            on='Date', 
-            how='left'
-        )
-        
-        # Compute benchmark returns
-        df['benchmark_returns'] = df['Benchmark_Close'].pct_change()
-        
-        # Compute rolling beta using simpler approach
-        def calculate_beta(stock_df):
-            """Calculate beta for a stock"""
-            # Get valid data
-            valid_data = stock_df[['returns', 'benchmark_returns']].dropna()
-            
-            if len(valid_data) < 20:
-                return pd.Series([1.0] * len(stock_df), index=stock_df.index)
-            
-            # Calculate rolling beta
-            betas = []
-            for i in range(len(stock_df)):
-                if i < 60:
-                    betas.append(1.0)  # Default beta for early data
-                else:
-                    # Get last 60 days of data
-                    window_start = max(0, i - 60)
-                    window_data = stock_df.iloc[window_start:i][['returns', 'benchmark_returns']].dropna()
-                    
-                    if len(window_data) >= 20:
-                        # Calculate covariance and variance
-                        cov_matrix = window_data.cov()
-                        if 'benchmark_returns' in cov_matrix.columns and len(cov_matrix) > 1:
-                            covariance = cov_matrix.loc['returns', 'benchmark_returns']
-                            variance = window_data['benchmark_returns'].var()
-                            
-                            if variance > 0:
-                                beta = covariance / variance
-                                betas.append(beta)
-                            else:
-                                betas.append(1.0)
-                        else:
-                            betas.append(1.0)
-                    else:
-                        betas.append(1.0)
-            
-            return pd.Series(betas, index=stock_df.index)
-        
-        # Apply to each stock
-        df['beta'] = df.groupby('symbol', group_keys=False).apply(calculate_beta)
+        # Align benchmark closes to each row's date with a sorted lookup
+        # instead of a hash merge; the trailing NaT/NaN slot marks dates
+        # the benchmark does not have
+        benchmark_df = benchmark_df.drop_duplicates('Date').sort_values('Date')
+        bench_dates = np.append(benchmark_df['Date'].to_numpy(), np.datetime64('NaT', 'ns'))
+        bench_close = np.append(benchmark_df['Close'].to_numpy(dtype=float), np.nan)
+        
+        dates = df['Date'].to_numpy()
+        pos = np.searchsorted(bench_dates[:-1], dates)
+        pos[bench_dates[pos] != dates] = len(bench_dates) - 1
+        df['Benchmark_Close'] = bench_close[pos]
+        
+        # Benchmark returns over the same rows as each symbol's returns
+        prev_bench_close = df.groupby('symbol', observed=True, sort=False)['Benchmark_Close'].shift(1).to_numpy()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            df['benchmark_returns'] = bench_close[pos] / prev_bench_close - 1.0
+        
+        # Rolling beta over the previous 60 days (current day excluded) from
+        # rolling moments: beta = (E[rm] - E[r]E[m]) / (E[m^2] - E[m]^2)
+        valid = df['returns'].notna() & df['benchmark_returns'].notna()
+        r = df['returns'].where(valid)
+        m = df['benchmark_returns'].where(valid)
+        
+        # Shift all four moments once, then roll each with the shared helper
+        moments = pd.DataFrame({'r': r, 'm': m, 'rm': r * m, 'm2': m * m})
+        moments = moments.groupby(df['symbol'], observed=True, sort=False).shift(1)
+        moments['symbol'] = df['symbol']
+        rolling_moments = pd.DataFrame({
+            column: self._rolling_stat(moments, column, window=60, min_periods=20, stat='mean')
+            for column in ('r', 'm', 'rm', 'm2')
+        }).reindex(df.index)
+        
+        covariance = (
+            rolling_moments['rm'] - rolling_moments['r'] * rolling_moments['m']
+        ).to_numpy()
+        variance = (
+            rolling_moments['m2'] - rolling_moments['m'] ** 2
+        ).to_numpy()
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            beta = np.where(variance > 0, covariance / variance, 1.0)
+        
+        # Default beta for early data and windows without enough observations
+        early = df.groupby('symbol', observed=True, sort=False).cumcount().to_numpy() < 60
+        beta[early | np.isnan(beta)] = 1.0
+        
+        df['beta'] = beta
         
         return df
     
     def compute_sharpe_ratio(self, df: pd.DataFrame, risk_free_rate: float = 0.02) -> pd.DataFrame:
         """Compute rolling Sharpe ratio"""
-        df = df.copy()
-        
         # Rolling mean and std of returns (60-day window)
-        rolling_mean = df.groupby('symbol')['returns'].transform(
-            lambda x: x.rolling(window=60, min_periods=20).mean()
-        )
-        rolling_std = df.groupby('symbol')['returns'].transform(
-            lambda x: x.rolling(window=60, min_periods=20).std()
-        )
-        
-        # Annualize
-        annualized_return = rolling_mean * 252
-        annualized_std = rolling_std * np.sqrt(252)
+        mean, std = self._rolling_mean_std(df, 'returns', window=60, min_periods=20)
         
-        # Sharpe ratio
-        df['sharpe_ratio'] = (annualized_return - risk_free_rate) / annualized_std
+        # Annualized Sharpe ratio, computed on the arrays without extra Series
+        with np.errstate(divide='ignore', invalid='ignore'):
+            df['sharpe_ratio'] = (mean * 252 - risk_free_rate) / (std * np.sqrt(252))
         
         return df
     
     def compute_atr(self, df: pd.DataFrame, window: int = 14) -> pd.DataFrame:
         """Compute Average True Range (volatility measure)"""
-        df = df.copy()
-        
-        # True Range
-        df['high_low'] = df['High'] - df['Low']
-        df['high_close'] = abs(df['High'] - df.groupby('symbol')['Close'].shift(1))
-        df['low_close'] = abs(df['Low'] - df.groupby('symbol')['Close'].shift(1))
-        
-        df['true_range'] = df[['high_low', 'high_close', 'low_close']].max(axis=1)
-        
-        # Average True Range
-        df['atr'] = df.groupby('symbol')['true_range'].transform(
-            lambda x: x.rolling(window=window, min_periods=5).mean()
-        )
+        # True Range (fmax skips the NaN previous close on each symbol's first row)
+        high = df['High'].to_numpy(dtype=float)
+        low = df['Low'].to_numpy(dtype=float)
+        prev_close = df.groupby('symbol', observed=True, sort=False)['Close'].shift(1).to_numpy(dtype=float)
+        high_close = np.abs(high - prev_close)
+        low_close = np.abs(low - prev_close)
+        
+        df['true_range'] = np.fmax.reduce([high - low, high_close, low_close])
+        
+        # Wilder's ATR: seeded with the mean of the first `window` true ranges,
+        # then ATR_t = (ATR_{t-1} * (window - 1) + TR_t) / window, an EWM with alpha = 1/window
+        position = df.groupby('symbol', observed=True, sort=False).cumcount().to_numpy()
+        seed = self._rolling_stat(df, 'true_range', window=window, min_periods=window, stat='mean')
+        seeded = df['true_range'].where(position >= window, seed).where(position >= window - 1)
+        
+        wilder = seeded.groupby(df['symbol'], observed=True, sort=False).ewm(
+            alpha=1 / window, adjust=False
+        ).mean()
+        df['atr'] = self._align(wilder)
         
         # ATR as percentage of price
         df['atr_pct'] = (df['atr'] / df['Close']) * 100
         
         # Clean up
-        df = df.drop(columns=['high_low', 'high_close', 'low_close', 'true_range', 'atr'])
+        df.drop(columns=['true_range', 'atr'], inplace=True)
         
         return df
     
     def compute_liquidity_metrics(self, df: pd.DataFrame) -> pd.DataFrame:
         """Compute liquidity-based risk metrics"""
-        df = df.copy()
+        avg_volume, volume_std = self._rolling_mean_std(df, 'Volume', window=20, min_periods=10)
         
         # Average volume (20-day)
-        df['avg_volume_20d'] = df.groupby('symbol')['Volume'].transform(
-            lambda x: x.rolling(window=20, min_periods=10).mean()
-        )
+        df['avg_volume_20d'] = avg_volume
         
         # Volume volatility (indicator of liquidity risk)
-        df['volume_volatility'] = df.groupby('symbol')['Volume'].transform(
-            lambda x: x.rolling(window=20, min_periods=10).std()
-        )
+        df['volume_volatility'] = volume_std
         
         # Liquidity risk score (normalized)
         df['liquidity_risk'] = df['volume_volatility'] / (df['avg_volume_20d'] + 1e-9)
@@ -196,20 +290,45 @@ class MarketDataAgent:
         benchmark_data['Date'] = pd.to_datetime(benchmark_data['Date'])
         
         # Sort by symbol and date
-        market_data = market_data.sort_values(['symbol', 'Date'])
+        market_data = market_data.sort_values(['symbol', 'Date'], ignore_index=True)
         benchmark_data = benchmark_data.sort_values('Date')
         
+        # Group on integer category codes instead of hashing symbol strings
+        market_data['symbol'] = market_data['symbol'].astype('category')
+        
+        # float32 holds the source price precision at half the memory traffic
+        price_cols = ['Open', 'High', 'Low', 'Close']
+        market_data[price_cols] = market_data[price_cols].astype(np.float32)
+        
         # Compute features
         df = self.compute_returns(market_data)
-        df = self.compute_volatility(df)
-        df = self.compute_max_drawdown(df)
-        df = self.compute_beta(df, benchmark_data)
-        df = self.compute_sharpe_ratio(df)
-        df = self.compute_atr(df)
-        df = self.compute_liquidity_metrics(df)
+        
+        # The remaining features only depend on returns and the raw prices,
+        # so run them concurrently, each on its own copy of the columns it reads
+        tasks = [
+            (self.compute_volatility, ['symbol', 'returns'], ()),
+            (self.compute_max_drawdown, ['symbol', 'Close'], ()),
+            (self.compute_beta, ['symbol', 'Date', 'returns'], (benchmark_data,)),
+            (self.compute_sharpe_ratio, ['symbol', 'returns'], ()),
+            (self.compute_atr, ['symbol', 'High', 'Low', 'Close'], ()),
+            (self.compute_liquidity_metrics, ['symbol', 'Volume'], ()),
+        ]
+        
+        with ThreadPoolExecutor(max_workers=len(tasks)) as executor:
+            futures = [
+                (executor.submit(compute, df[columns].copy(), *args), columns)
+                for compute, columns, args in tasks
+            ]
+            
+            # Keep only the columns each task added
+            features = []
+            for future, columns in futures:
+                features.append(future.result().drop(columns=columns))
+        
+        df = pd.concat([df] + features, axis=1)
         
         # Handle infinities and NaNs
-        df = df.replace([np.inf, -np.inf], np.nan)
+        df.replace([np.inf, -np.inf], np.nan, inplace=True)
         
         log.info(f"✓ Computed features for {df['symbol'].nunique()} stocks")
         
@@ -224,15 +343,15 @@ class MarketDataAgent:
         log.info("=" * 60)
         
         with DatabaseService() as db:
-            # Load market data from database
+            # Find the stocks to process; their data is loaded in batches below
             log.info("Loading market data from database...")
-            market_data = db.get_market_data(days=730)  # 2 years of data
+            symbols = db.get_market_data_symbols(days=730)  # 2 years of data
             
-            if market_data.empty:
+            if not symbols:
                 log.error("No market data found in database!")
                 return None
             
-            log.info(f"Loaded {len(market_data)} market data records")
+            log.info(f"Found market data for {len(symbols)} stocks")
             
             # Load benchmark data (SPY)
             log.info("Loading benchmark data...")
@@ -241,19 +360,29 @@ class MarketDataAgent:
             if benchmark_data.empty:
                 log.warning("No benchmark data found, using market average as proxy")
                 # Create synthetic benchmark from market average
-                benchmark_data = market_data.groupby('Date').agg({
-                    'Close': 'mean',
-                    'Volume': 'sum'
-                }).reset_index()
+                benchmark_data = db.get_market_average(days=730)
                 benchmark_data['symbol'] = 'BENCHMARK'
             
-            # Compute all features
-            features_df = self.compute_all_features(market_data, benchmark_data)
+            # Compute all features one symbol batch at a time, so only a
+            # batch's raw data and intermediates are held in memory
+            batches = []
+            for start in range(0, len(symbols), SYMBOL_BATCH_SIZE):
+                batch_symbols = symbols[start:start + SYMBOL_BATCH_SIZE]
+                market_data = db.get_market_data(days=730, symbols=batch_symbols)
+                log.info(f"Loaded {len(market_data)} market data records for {len(batch_symbols)} stocks")
+                
+                batches.append(self.compute_all_features(market_data, benchmark_data))
+            
+            features_df = pd.concat(batches, ignore_index=True)
             
             # Features are already part of market_data, just return
             log.info("✓ Market features computed successfully")
             
             return features_df
+    
+    def run(self):
+        """Run the agent (alias of process, matching the other agents' run())"""
+        return self.process()
 
 def main():
     """Main execution"""
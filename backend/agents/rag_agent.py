@@ -2,23 +2,186 @@
 RAG Agent - Retrieval-Augmented Generation for explainable insights
 """
 import os
+import re
+import pickle
+import threading
+import requests
+from bisect import bisect_left, bisect_right
 import pandas as pd
 import numpy as np
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple, Union
 from datetime import datetime
 import json
 from pathlib import Path
 
+import faiss
+import torch
+from joblib import Parallel, delayed
+
 # LangChain imports
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_community.docstore.base import Docstore
 from langchain.docstore.document import Document
 from langchain_community.llms import Ollama
 from langchain.chains import RetrievalQA
 from langchain.prompts import PromptTemplate
 
-from backend.utils import log, load_config, load_dataframe, ensure_dir
+from backend.utils import log, load_config, load_dataframe, ensure_dir, TTLCache
+
+# IVF training needs at least this many vectors per inverted list
+# (faiss' own minimum); smaller corpora use an exact flat index
+IVF_MIN_POINTS_PER_LIST = 39
+
+# Training sample size per inverted list (faiss' k-means subsamples to this)
+IVF_TRAIN_POINTS_PER_LIST = 256
+
+# Supported `index_type` settings
+INDEX_TYPES = ('flat', 'ivfsq8', 'ivfpq')
+
+# Inverted lists scanned per query on IVF indexes (rag `nprobe` setting):
+# recall and search time both grow with it, up to an exact scan at nlist
+DEFAULT_NPROBE = 16
+
+# Split article texts across worker processes above this many articles
+# (below it, process start-up costs more than the splitting)
+PARALLEL_SPLIT_MIN_ARTICLES = 2000
+
+# Query embeddings kept per agent (least recently used evicted first)
+QUERY_CACHE_SIZE = 1024
+
+# Seconds to wait for an LLM provider's health check at start-up
+LLM_HEALTH_TIMEOUT = 1.0
+
+# Analyst instructions, sent as the system prompt so the identical prefix
+# can be reused by the provider's prompt cache across queries
+LLM_SYSTEM_PROMPT = """You are a financial risk analyst. Based on the news articles provided, give a clear and concise explanation.
+
+Provide a professional analysis that:
+1. Summarizes the key points from the news
+2. Explains the risk factors or opportunities
+3. Maintains objectivity and cites specific information
+4. Keeps the response under 200 words"""
+
+# Per-query part of the analyst prompt
+LLM_USER_PROMPT = """Stock: {stock_symbol}
+Question: {query}
+
+News Articles:
+{context}
+
+Analysis:"""
+
+# LLM context budget, in characters (~1200 tokens at ~4 characters per token)
+CONTEXT_MAX_CHARS = 4800
+
+# Sentences less similar than this to the query are dropped from the LLM
+# context (each chunk still keeps its best sentence)
+CONTEXT_MIN_SIMILARITY = 0.2
+
+# Sentence boundaries within a chunk
+_SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+')
+
+# Element-wise str() and str.isspace() over object arrays
+_to_str = np.frompyfunc(str, 1, 1)
+_is_space = np.frompyfunc(str.isspace, 1, 1)
+
+# Chunk boundaries, strongest first: paragraph, line, sentence, word
+_SPLIT_BOUNDARY = re.compile(r'(\n\n)|(\n)|(\. )|( )')
+
+def _split_text(text: str, chunk_size: int, chunk_overlap: int) -> List[str]:
+    """
+    Split text into chunks of at most chunk_size characters
+    
+    Boundaries are found in a single regex pass. Each chunk ends at the
+    strongest boundary in the back half of its window (else the last one, else
+    a hard cut), and the next chunk starts at a boundary about chunk_overlap
+    characters earlier.
+    
+    Args:
+        text: Text to split
+        chunk_size: Maximum chunk length in characters
+        chunk_overlap: Approximate overlap between consecutive chunks
+        
+    Returns:
+        List of non-empty chunks
+    """
+    text = text.strip()
+    if len(text) <= chunk_size:
+        return [text] if text else []
+    
+    # For each boundary: where a chunk may end, where the next may start,
+    # and its strength (0 = paragraph ... 3 = word)
+    cuts, resumes, strengths = [], [], []
+    for match in _SPLIT_BOUNDARY.finditer(text):
+        strength = match.lastindex - 1
+        cuts.append(match.start() + (1 if strength == 2 else 0))  # keep the period
+        resumes.append(match.end())
+        strengths.append(strength)
+    
+    chunks = []
+    start = end = 0
+    
+    while start < len(text):
+        limit = start + chunk_size
+        if limit >= len(text):
+            chunks.append(text[start:])
+            break
+        
+        # Candidate boundaries past the previous chunk's end
+        lo = bisect_right(cuts, max(start, end))
+        hi = bisect_right(cuts, limit)
+        
+        if lo < hi:
+            # Strongest boundary in the back half of the window, else the strongest one
+            back = bisect_left(cuts, start + chunk_size // 2, lo, hi)
+            candidates = range(back, hi) if back < hi else range(lo, hi)
+            best = min(candidates, key=lambda i: (strengths[i], -i))
+            end, resume_at = cuts[best], resumes[best]
+        else:
+            # No boundary: hard cut, overlapping by characters
+            end = limit
+            resume_at = max(end - chunk_overlap, start + 1)
+        
+        chunks.append(text[start:end])
+        
+        # Step back by about chunk_overlap, to the next boundary after that point
+        i = bisect_left(resumes, end - chunk_overlap)
+        if i < len(resumes) and start < resumes[i] < end:
+            start = resumes[i]
+        else:
+            start = resume_at
+    
+    return [chunk.strip() for chunk in chunks if chunk.strip()]
+
+class ChunkFrameDocstore(Docstore):
+    """
+    Docstore over a chunk DataFrame (one row per FAISS index position)
+    
+    Chunks are kept as columns rather than a Document per chunk; a Document
+    is only created when a search result is looked up.
+    """
+    
+    def __init__(self, frame: pd.DataFrame):
+        """
+        Args:
+            frame: Chunk metadata with a 'page_content' column, indexed 0..N-1
+        """
+        self.frame = frame
+    
+    def search(self, search: str) -> Union[str, Document]:
+        """Document for a docstore id (the index position as a string)"""
+        try:
+            position = int(search)
+        except ValueError:
+            return f"ID {search} not found."
+        
+        if not 0 <= position < len(self.frame):
+            return f"ID {search} not found."
+        
+        metadata = self.frame.iloc[[position]].to_dict('records')[0]
+        return Document(page_content=metadata.pop('page_content'), metadata=metadata)
 
 class NewsRAGAgent:
     """
@@ -41,19 +204,47 @@ class NewsRAGAgent:
         # Vector store will be initialized when data is loaded
         self.vector_store = None
         
+        # Columnar chunk metadata, built lazily for the current store
+        self.chunk_meta = None
+        self._chunk_meta_store = None
+        self._symbol_positions = {}
+        self._article_ids = np.empty(0, dtype=np.int64)
+        
+        # Query text -> embedding; the model is fixed, so entries never go stale
+        self._query_cache = TTLCache(maxsize=QUERY_CACHE_SIZE, ttl=float('inf'))
+        
         log.info("✓ RAG Agent initialized")
     
     def _init_embeddings(self):
         """Initialize embedding model"""
         log.info(f"Loading embedding model: {self.agent_config['embedding_model']}")
         
+        # Encode on the GPU when there is one; larger batches keep it busy
+        device = self.agent_config.get('embedding_device', 'auto')
+        if device == 'auto':
+            device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        
+        self.embedding_batch_size = self.agent_config.get('embedding_batch_size') or (
+            512 if device.startswith('cuda') else 64
+        )
+        
         try:
             self.embeddings = HuggingFaceEmbeddings(
                 model_name=self.agent_config['embedding_model'],
-                model_kwargs={'device': 'cpu'},
-                encode_kwargs={'normalize_embeddings': True}
+                model_kwargs={'device': device},
+                encode_kwargs={
+                    'batch_size': self.embedding_batch_size,
+                    'normalize_embeddings': True
+                }
             )
-            log.info("✓ Embedding model loaded")
+            
+            # bf16 weights speed up encoding on CPUs with AVX512-BF16/AMX;
+            # encode() still returns float32 numpy arrays
+            if self.agent_config.get('embedding_dtype') == 'bfloat16':
+                self.embeddings.client.to(torch.bfloat16)
+                log.info("Embedding model weights cast to bfloat16")
+            
+            log.info(f"✓ Embedding model loaded on {device}")
         except Exception as e:
             log.error(f"Failed to load embedding model: {str(e)}")
             raise
@@ -68,13 +259,12 @@ class NewsRAGAgent:
             try:
                 from backend.services.groq_client import GroqLLM
                 self.llm = GroqLLM(model="llama-3.3-70b-versatile", temperature=0.3)
-                # Test connection
-                test = self.llm.invoke("Reply with just the word OK")
-                if test and "Error" not in test:
+                # Check the endpoint rather than running a test generation
+                if self.llm.is_available(timeout=LLM_HEALTH_TIMEOUT):
                     log.info("✓ Groq LLM connected successfully")
                     return
                 else:
-                    log.warning(f"Groq test failed: {test}")
+                    log.warning("Groq test failed")
                     self.llm = None
             except Exception as e:
                 log.warning(f"Groq not available: {e}")
@@ -85,14 +275,24 @@ class NewsRAGAgent:
             log.info(f"Initializing Ollama LLM: {llm_config['model']}")
             
             try:
+                base_url = "http://localhost:11434"
+                
+                # Check the server is up and the model is pulled (lists local
+                # models; no generation)
+                response = requests.get(f"{base_url}/api/tags", timeout=LLM_HEALTH_TIMEOUT)
+                response.raise_for_status()
+                model_names = {model.get('name', '') for model in response.json().get('models', [])}
+                if not any(
+                    name == llm_config['model'] or name.startswith(f"{llm_config['model']}:")
+                    for name in model_names
+                ):
+                    raise RuntimeError(f"model '{llm_config['model']}' not found on Ollama server")
+                
                 self.llm = Ollama(
                     model=llm_config['model'],
                     temperature=0.3,
-                    base_url="http://localhost:11434"
+                    base_url=base_url
                 )
-                
-                # Test connection
-                test_response = self.llm.invoke("Hello")
                 log.info("✓ Ollama LLM connected successfully")
                 
             except Exception as e:
@@ -123,95 +323,236 @@ class NewsRAGAgent:
             log.warning("No news data found")
             return pd.DataFrame()
     
-    def chunk_documents(self, news_df: pd.DataFrame) -> List[Document]:
+    def chunk_documents(self, news_df: pd.DataFrame) -> Tuple[List[str], pd.DataFrame]:
         """
-        Chunk news articles into smaller documents
+        Chunk news articles into smaller texts
         
         Args:
             news_df: DataFrame with news articles
             
         Returns:
-            List of Document objects
+            Tuple of (chunk texts, chunk metadata DataFrame with one row per chunk)
         """
         log.info("Chunking documents...")
         
         if news_df.empty:
             log.warning("No documents to chunk")
-            return []
+            return [], pd.DataFrame()
+        
+        chunk_size = self.agent_config['chunk_size']
+        chunk_overlap = self.agent_config['chunk_overlap']
+        
+        # Combine headline and description for all articles at once, as
+        # object arrays (numpy's element-wise str ops skip pandas' overhead)
+        empty = pd.Series('', index=news_df.index)
+        headlines = _to_str(news_df.get('headline', empty).to_numpy(dtype=object, na_value=''))
+        descriptions = _to_str(news_df.get('description', empty).to_numpy(dtype=object, na_value=''))
+        texts = pd.Series(headlines + ' ' + descriptions, index=news_df.index, dtype=object)
+        has_text = ~_is_space(texts.to_numpy()).astype(bool)
+        
+        # Metadata columns, with defaults for columns the frame lacks
+        meta_defaults = {
+            'source': 'Unknown',
+            'stock_symbol': 'GENERAL',
+            'published_date': '',
+            'url': '',
+            'sentiment_label': 'neutral',
+            'sentiment_score': 0.0,
+            'headline': ''
+        }
+        meta_df = pd.DataFrame({
+            name: news_df[name] if name in news_df else default
+            for name, default in meta_defaults.items()
+        }, index=news_df.index)[has_text]
+        meta_df['published_date'] = meta_df['published_date'].astype(str)
+        meta_df['sentiment_score'] = meta_df['sentiment_score'].astype(float)
+        texts = texts[has_text]
         
-        # Initialize text splitter
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=self.agent_config['chunk_size'],
-            chunk_overlap=self.agent_config['chunk_overlap'],
-            length_function=len,
-            separators=["\n\n", "\n", ". ", " ", ""]
+        # Syndicated copies of a headline (per stock) are embedded once; the
+        # first copy records the other copies' URLs
+        headline_key = meta_df['headline'].fillna('').astype(str).str.strip().str.lower()
+        keys = pd.util.hash_pandas_object(
+            pd.DataFrame({'symbol': meta_df['stock_symbol'], 'headline': headline_key}),
+            index=False
         )
+        is_copy = keys.duplicated() & headline_key.ne('')
         
-        documents = []
+        copy_urls = meta_df['url'][is_copy]
+        has_url = copy_urls.notna() & copy_urls.ne('')
+        duplicate_urls = copy_urls[has_url].groupby(keys[is_copy][has_url]).agg(tuple)
         
-        for idx, row in news_df.iterrows():
-            # Combine headline and description
-            text = f"{row.get('headline', '')} {row.get('description', '')}"
-            
-            if not text.strip():
-                continue
-            
-            # Split text into chunks
-            chunks = text_splitter.split_text(text)
-            
-            for chunk in chunks:
-                # Create metadata
-                metadata = {
-                    'source': row.get('source', 'Unknown'),
-                    'stock_symbol': row.get('stock_symbol', 'GENERAL'),
-                    'published_date': str(row.get('published_date', '')),
-                    'url': row.get('url', ''),
-                    'sentiment_label': row.get('sentiment_label', 'neutral'),
-                    'sentiment_score': float(row.get('sentiment_score', 0.0)),
-                    'headline': row.get('headline', '')
-                }
-                
-                # Create document
-                doc = Document(
-                    page_content=chunk,
-                    metadata=metadata
-                )
-                
-                documents.append(doc)
+        meta_df = meta_df[~is_copy]
+        texts = texts[~is_copy]
+        meta_df['duplicate_urls'] = [duplicate_urls.get(key, ()) for key in keys[~is_copy]]
+        
+        if is_copy.any():
+            log.info(f"Skipped {int(is_copy.sum())} duplicate headlines")
         
-        log.info(f"✓ Created {len(documents)} document chunks from {len(news_df)} articles")
-        return documents
+        # Split texts into chunks (pure-Python work, so use processes)
+        texts = texts.tolist()
+        if len(texts) >= PARALLEL_SPLIT_MIN_ARTICLES:
+            chunks_per_article = Parallel(n_jobs=-1, batch_size=64)(
+                delayed(_split_text)(text, chunk_size, chunk_overlap) for text in texts
+            )
+        else:
+            chunks_per_article = [_split_text(text, chunk_size, chunk_overlap) for text in texts]
+        
+        # One metadata row per chunk, repeated from its article
+        chunk_counts = [len(chunks) for chunks in chunks_per_article]
+        chunk_meta = meta_df.iloc[np.repeat(np.arange(len(meta_df)), chunk_counts)]
+        chunk_meta = chunk_meta.reset_index(drop=True)
+        chunk_texts = [chunk for chunks in chunks_per_article for chunk in chunks]
+        
+        log.info(f"✓ Created {len(chunk_texts)} document chunks from {len(news_df)} articles")
+        return chunk_texts, chunk_meta
     
-    def build_vector_store(self, documents: List[Document]) -> FAISS:
+    def build_vector_store(self, texts: List[str], metadata: pd.DataFrame) -> FAISS:
         """
-        Build FAISS vector store from documents
+        Build FAISS vector store from chunk texts
         
         Args:
-            documents: List of Document objects
+            texts: Chunk texts
+            metadata: Chunk metadata, one row per text
             
         Returns:
             FAISS vector store
         """
         log.info("Building FAISS vector store...")
         
-        if not documents:
+        if not texts:
             log.warning("No documents to index")
             return None
         
         try:
-            # Create FAISS index
-            vector_store = FAISS.from_documents(
-                documents=documents,
-                embedding=self.embeddings
+            # Embed all chunks (embeddings are normalized, so inner product = cosine)
+            vectors = self._embed_texts(texts)
+            
+            index = self._build_index(vectors)
+            
+            chunk_meta = metadata.reset_index(drop=True)
+            chunk_meta['page_content'] = texts
+            
+            vector_store = FAISS(
+                embedding_function=self.embeddings,
+                index=index,
+                docstore=ChunkFrameDocstore(chunk_meta),
+                index_to_docstore_id={i: str(i) for i in range(len(texts))},
+                distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT
             )
             
-            log.info(f"✓ Vector store built with {len(documents)} documents")
+            log.info(f"✓ Vector store built with {len(texts)} documents")
             return vector_store
             
         except Exception as e:
             log.error(f"Failed to build vector store: {str(e)}")
             return None
     
+    def _embed_texts(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed texts with one encode call using large batches
+        
+        Args:
+            texts: Texts to embed
+            
+        Returns:
+            Normalized embeddings as a float32 array, shape (len(texts), d)
+        """
+        vectors = self.embeddings.client.encode(
+            texts,
+            batch_size=self.embedding_batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        )
+        return np.asarray(vectors, dtype=np.float32)
+    
+    def _embed_queries(self, queries: List[str]) -> np.ndarray:
+        """
+        Embed queries, reusing cached vectors for repeated query strings
+        
+        Args:
+            queries: Search queries
+            
+        Returns:
+            Normalized embeddings as a float32 array, shape (len(queries), d)
+        """
+        cached = [self._query_cache.get(query) for query in queries]
+        missing = list(dict.fromkeys(
+            query for query, vector in zip(queries, cached) if vector is None
+        ))
+        
+        if missing:
+            # One embedding call for all uncached queries
+            fresh = dict(zip(missing, self._embed_texts(missing)))
+            for query, vector in fresh.items():
+                vector.setflags(write=False)
+                self._query_cache.set(query, vector)
+            cached = [
+                vector if vector is not None else fresh[query]
+                for query, vector in zip(queries, cached)
+            ]
+        
+        return np.stack(cached)
+    
+    def _build_index(self, vectors: np.ndarray) -> faiss.Index:
+        """
+        Build an inner-product FAISS index over the chunk embeddings
+        
+        The index type comes from the rag `index_type` setting:
+        - flat: exact search
+        - ivfsq8: IVF with 8-bit scalar quantization (4x smaller than float32,
+          near-exact recall)
+        - ivfpq: IVF-PQ with d/8 sub-quantizers of 8 bits (smallest)
+        IVF indexes use nlist ~ 4*sqrt(N) and fall back to flat search until
+        the corpus is large enough to train them.
+        
+        Args:
+            vectors: Normalized embeddings, shape (N, d)
+            
+        Returns:
+            Trained FAISS index containing all vectors
+        """
+        n, d = vectors.shape
+        nlist = max(1, int(4 * np.sqrt(n)))
+        
+        index_type = self.agent_config.get('index_type', 'ivfsq8')
+        if index_type not in INDEX_TYPES:
+            log.warning(f"Unknown index_type '{index_type}', using ivfsq8")
+            index_type = 'ivfsq8'
+        
+        if index_type == 'flat' or n < nlist * IVF_MIN_POINTS_PER_LIST:
+            index = faiss.IndexFlatIP(d)
+            index.add(vectors)
+            return index
+        
+        if index_type == 'ivfsq8':
+            description = f"IVF{nlist},SQ8"
+        else:
+            # Number of PQ sub-quantizers must divide the dimension
+            m = max(1, d // 8)
+            while d % m:
+                m -= 1
+            description = f"IVF{nlist},PQ{m}x8"
+        
+        # k-means only looks at IVF_TRAIN_POINTS_PER_LIST points per list,
+        # so train on a sample rather than the whole corpus
+        n_train = min(n, nlist * IVF_TRAIN_POINTS_PER_LIST)
+        train_rows = np.random.default_rng(0).choice(n, n_train, replace=False)
+        
+        index = faiss.index_factory(d, description, faiss.METRIC_INNER_PRODUCT)
+        index.train(vectors[np.sort(train_rows)])
+        index.add(vectors)
+        self._configure_search(index)
+        
+        log.info(f"Built {description} index over {n} vectors")
+        return index
+    
+    def _configure_search(self, index: faiss.Index):
+        """Apply the configured nprobe to an IVF index (no-op for flat indexes)"""
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None:
+            ivf.nprobe = min(self.agent_config.get('nprobe') or DEFAULT_NPROBE, ivf.nlist)
+    
     def save_vector_store(self, vector_store: FAISS):
         """
         Save vector store to disk
@@ -229,7 +570,25 @@ class NewsRAGAgent:
         save_path = f"{vector_db_path}/faiss_index"
         
         try:
-            vector_store.save_local(save_path)
+            # Same files as save_local, but written to temporary names and
+            # renamed into place: rewriting index.faiss in place would corrupt
+            # processes that have it memory-mapped (see load_vector_store)
+            save_dir = Path(save_path)
+            save_dir.mkdir(parents=True, exist_ok=True)
+            
+            tmp_index = save_dir / 'index.faiss.tmp'
+            faiss.write_index(vector_store.index, str(tmp_index))
+            
+            tmp_pkl = save_dir / 'index.pkl.tmp'
+            with open(tmp_pkl, 'wb') as f:
+                pickle.dump(
+                    (vector_store.docstore, vector_store.index_to_docstore_id),
+                    f,
+                    protocol=pickle.HIGHEST_PROTOCOL
+                )
+            
+            os.replace(tmp_index, save_dir / 'index.faiss')
+            os.replace(tmp_pkl, save_dir / 'index.pkl')
             log.info(f"✓ Vector store saved to {save_path}")
         except Exception as e:
             log.error(f"Failed to save vector store: {str(e)}")
@@ -249,10 +608,28 @@ class NewsRAGAgent:
             return None
         
         try:
-            vector_store = FAISS.load_local(
-                load_path,
-                self.embeddings,
-                allow_dangerous_deserialization=True
+            # Memory-map the index (same files save_local writes) so only the
+            # pages that searches touch become resident
+            index = faiss.read_index(
+                str(Path(load_path) / 'index.faiss'),
+                faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+            )
+            self._configure_search(index)
+            
+            with open(Path(load_path) / 'index.pkl', 'rb') as f:
+                docstore, index_to_docstore_id = pickle.load(f)
+            
+            if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+                distance_strategy = DistanceStrategy.MAX_INNER_PRODUCT
+            else:
+                distance_strategy = DistanceStrategy.EUCLIDEAN_DISTANCE
+            
+            vector_store = FAISS(
+                embedding_function=self.embeddings,
+                index=index,
+                docstore=docstore,
+                index_to_docstore_id=index_to_docstore_id,
+                distance_strategy=distance_strategy
             )
             log.info(f"✓ Vector store loaded from {load_path}")
             return vector_store
@@ -277,33 +654,188 @@ class NewsRAGAgent:
         Returns:
             List of relevant documents
         """
+        positions = self._retrieve_positions([query], [stock_symbol], k)[0]
+        docs = self._documents_at(positions)
+        
+        log.info(f"Retrieved {len(docs)} documents for query: '{query}'")
+        return docs
+    
+    def retrieve_documents_batch(
+        self,
+        queries: List[str],
+        stock_symbols: List[Optional[str]],
+        k: int = None
+    ) -> List[List[Document]]:
+        """
+        Retrieve relevant documents for several queries at once
+        
+        Args:
+            queries: Search queries
+            stock_symbols: Stock symbol filter for each query (None for no filter)
+            k: Number of documents to retrieve per query
+            
+        Returns:
+            List of document lists, in query order
+        """
+        results = [
+            self._documents_at(positions)
+            for positions in self._retrieve_positions(queries, stock_symbols, k)
+        ]
+        
+        log.info(f"Retrieved documents for {len(queries)} queries in batch")
+        return results
+    
+    def _retrieve_positions(
+        self,
+        queries: List[str],
+        stock_symbols: List[Optional[str]],
+        k: int = None
+    ) -> List[np.ndarray]:
+        """
+        Index positions of the most relevant chunks for each query
+        
+        Args:
+            queries: Search queries
+            stock_symbols: Stock symbol filter for each query (None for no filter)
+            k: Number of chunks to retrieve per query
+            
+        Returns:
+            List of position arrays, in query order (empty on failure)
+        """
+        no_results = [np.empty(0, dtype=np.int64) for _ in queries]
+        
         if self.vector_store is None:
             log.warning("Vector store not initialized")
-            return []
+            return no_results
         
         if k is None:
             k = self.agent_config['top_k']
         
         try:
-            # Create search kwargs
-            search_kwargs = {'k': k * 2}  # Get more initially for filtering
+            query_vectors = self._embed_queries(queries)
+            results = self._search(query_vectors, stock_symbols, k)
+            return [self._first_per_article(positions) for positions in results]
             
-            # Search
-            docs = self.vector_store.similarity_search(query, **search_kwargs)
+        except Exception as e:
+            log.error(f"Document retrieval failed: {str(e)}")
+            return no_results
+    
+    def _search(
+        self,
+        query_vectors: np.ndarray,
+        stock_symbols: List[Optional[str]],
+        k: int
+    ) -> List[np.ndarray]:
+        """
+        Search the index, restricting each query to its stock's chunks
+        
+        Symbol filters are applied inside FAISS with an ID selector, so each
+        query gets its top-k among that stock's chunks without oversampling.
+        Unfiltered queries share one batched search.
+        
+        Args:
+            query_vectors: Query embeddings, shape (Q, d)
+            stock_symbols: Stock symbol filter for each query (None for no filter)
+            k: Number of chunks to retrieve per query
             
-            # Filter by stock symbol if provided
-            if stock_symbol:
-                docs = [doc for doc in docs if doc.metadata.get('stock_symbol') == stock_symbol]
+        Returns:
+            List of index position arrays, in query order
+        """
+        index = self.vector_store.index
+        results = [np.empty(0, dtype=np.int64) for _ in stock_symbols]
+        
+        unfiltered = [i for i, symbol in enumerate(stock_symbols) if not symbol]
+        if unfiltered:
+            _, indices = index.search(query_vectors[unfiltered], k)
+            for i, row in zip(unfiltered, indices):
+                results[i] = row[row != -1]
+        
+        self._get_chunk_meta()
+        ivf = faiss.try_extract_index_ivf(index)
+        
+        for i, symbol in enumerate(stock_symbols):
+            if not symbol or symbol not in self._symbol_positions:
+                continue
             
-            # Limit to k results
-            docs = docs[:k]
+            selector = faiss.IDSelectorBatch(self._symbol_positions[symbol])
+            if ivf is not None:
+                params = faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+            else:
+                params = faiss.SearchParameters(sel=selector)
             
-            log.info(f"Retrieved {len(docs)} documents for query: '{query}'")
-            return docs
+            _, indices = index.search(query_vectors[i:i + 1], k, params=params)
+            results[i] = indices[0][indices[0] != -1]
+        
+        return results
+    
+    def _first_per_article(self, positions: np.ndarray) -> np.ndarray:
+        """Keep the best-ranked chunk of each article, preserving rank order"""
+        self._get_chunk_meta()
+        
+        _, first = np.unique(self._article_ids[positions], return_index=True)
+        return positions[np.sort(first)]
+    
+    def _documents_at(self, positions: np.ndarray) -> List[Document]:
+        """Look up the documents at FAISS index positions"""
+        index_to_id = self.vector_store.index_to_docstore_id
+        docstore = self.vector_store.docstore
+        
+        return [docstore.search(index_to_id[i]) for i in positions]
+    
+    def _get_chunk_meta(self) -> pd.DataFrame:
+        """
+        Columnar chunk store for the current vector store
+        
+        One row per FAISS index position holding the chunk text and one column
+        per metadata key, so lookups are array indexing rather than a dict per
+        Document. Stores built here already hold it (ChunkFrameDocstore); for
+        stores saved with a Document per chunk it is built from the docstore.
+        Set up once per vector store, together with the index
+        positions of each stock symbol's chunks and an article id per chunk
+        (chunks sharing a URL share an id; chunks without one get their own).
+        
+        Returns:
+            DataFrame indexed by FAISS position
+        """
+        if self._chunk_meta_store is not self.vector_store:
+            docstore = self.vector_store.docstore
             
-        except Exception as e:
-            log.error(f"Document retrieval failed: {str(e)}")
-            return []
+            if isinstance(docstore, ChunkFrameDocstore):
+                chunk_meta = docstore.frame
+            else:
+                # Stores saved with a Document per chunk
+                index_to_id = self.vector_store.index_to_docstore_id
+                docs = [docstore.search(index_to_id[i]) for i in range(len(index_to_id))]
+                
+                chunk_meta = pd.DataFrame.from_records([doc.metadata for doc in docs])
+                chunk_meta['page_content'] = [doc.page_content for doc in docs]
+            
+            if 'stock_symbol' in chunk_meta:
+                self._symbol_positions = chunk_meta.groupby('stock_symbol').indices
+            else:
+                self._symbol_positions = {}
+            
+            urls = chunk_meta.get('url', pd.Series(None, index=chunk_meta.index, dtype=object))
+            article_ids, uniques = pd.factorize(urls.mask(urls == ''))
+            no_url = article_ids == -1
+            article_ids[no_url] = len(uniques) + np.flatnonzero(no_url)
+            self._article_ids = article_ids
+            
+            self.chunk_meta = chunk_meta
+            self._chunk_meta_store = self.vector_store
+        
+        return self.chunk_meta
+    
+    def _chunk_values(self, positions: np.ndarray, column: str, default) -> np.ndarray:
+        """Values of one chunk metadata column at index positions, missing -> default"""
+        chunk_meta = self._get_chunk_meta()
+        
+        if column not in chunk_meta:
+            return np.full(len(positions), default, dtype=object)
+        
+        values = chunk_meta[column].to_numpy()[positions].astype(object)
+        values[pd.isna(values)] = default
+        return values
     
     def generate_explanation(
         self,
@@ -322,25 +854,97 @@ class NewsRAGAgent:
         """
         log.info(f"Generating explanation for: '{query}'")
         
-        # Retrieve relevant documents
-        docs = self.retrieve_documents(query, stock_symbol)
+        # Retrieve relevant chunks
+        positions = self._retrieve_positions([query], [stock_symbol])[0]
         
-        if not docs:
-            return {
-                'query': query,
-                'explanation': "No relevant information found in the news database.",
-                'sources': [],
-                'confidence': 0.0
-            }
+        if len(positions) == 0:
+            return self._empty_explanation(query)
         
         # Generate explanation
         if self.llm is not None:
-            explanation = self._generate_with_llm(query, docs, stock_symbol)
+            explanation = self._generate_with_llm(query, positions, stock_symbol)
         else:
-            explanation = self._generate_with_template(query, docs, stock_symbol)
+            explanation = self._generate_with_template(query, positions, stock_symbol)
+        
+        return self._build_explanation_result(query, positions, stock_symbol, explanation)
+    
+    def generate_explanation_batch(
+        self,
+        queries: List[str],
+        stock_symbols: List[Optional[str]]
+    ) -> List[Dict[str, any]]:
+        """
+        Generate explanations for several queries using RAG
+        
+        Retrieval runs as a single batched embedding + FAISS search and the
+        LLM prompts are sent as one batch.
         
-        # Extract sources
-        sources = self._extract_sources(docs)
+        Args:
+            queries: User queries
+            stock_symbols: Stock symbol to focus on for each query
+            
+        Returns:
+            List of explanation dictionaries, in query order
+        """
+        if not queries:
+            return []
+        
+        log.info(f"Generating {len(queries)} explanations in batch")
+        
+        positions_per_query = self._retrieve_positions(queries, stock_symbols)
+        pending = [i for i, positions in enumerate(positions_per_query) if len(positions)]
+        
+        explanations = {}
+        
+        if self.llm is not None and pending:
+            prompts = [
+                self._build_llm_prompt(queries[i], positions_per_query[i], stock_symbols[i])
+                for i in pending
+            ]
+            
+            try:
+                if hasattr(self.llm, 'batch'):
+                    responses = self.llm.batch(prompts, system=LLM_SYSTEM_PROMPT)
+                else:
+                    responses = [self.llm.invoke(prompt, system=LLM_SYSTEM_PROMPT) for prompt in prompts]
+                
+                for i, response in zip(pending, responses):
+                    explanations[i] = response.strip()
+            except Exception as e:
+                log.error(f"Batch LLM generation failed: {str(e)}")
+        
+        results = []
+        for i, (query, stock_symbol, positions) in enumerate(zip(queries, stock_symbols, positions_per_query)):
+            if len(positions) == 0:
+                results.append(self._empty_explanation(query))
+                continue
+            
+            explanation = explanations.get(i)
+            if explanation is None:
+                explanation = self._generate_with_template(query, positions, stock_symbol)
+            
+            results.append(self._build_explanation_result(query, positions, stock_symbol, explanation))
+        
+        return results
+    
+    def _empty_explanation(self, query: str) -> Dict[str, any]:
+        """Result returned when no relevant documents are found"""
+        return {
+            'query': query,
+            'explanation': "No relevant information found in the news database.",
+            'sources': [],
+            'confidence': 0.0
+        }
+    
+    def _build_explanation_result(
+        self,
+        query: str,
+        positions: np.ndarray,
+        stock_symbol: Optional[str],
+        explanation: str
+    ) -> Dict[str, any]:
+        """Assemble the explanation dictionary with sources and confidence"""
+        sources = self._extract_sources(positions)
         
         return {
             'query': query,
@@ -348,13 +952,13 @@ class NewsRAGAgent:
             'explanation': explanation,
             'sources': sources,
             'num_sources': len(sources),
-            'confidence': min(len(docs) / self.agent_config['top_k'], 1.0)
+            'confidence': min(len(positions) / self.agent_config['top_k'], 1.0)
         }
     
     def _generate_with_llm(
         self,
         query: str,
-        docs: List[Document],
+        positions: np.ndarray,
         stock_symbol: Optional[str]
     ) -> str:
         """
@@ -362,54 +966,105 @@ class NewsRAGAgent:
         
         Args:
             query: User query
-            docs: Retrieved documents
+            positions: Index positions of the retrieved chunks
             stock_symbol: Stock symbol
             
         Returns:
             Generated explanation
         """
-        # Create context from documents
+        prompt = self._build_llm_prompt(query, positions, stock_symbol)
+        
+        try:
+            response = self.llm.invoke(prompt, system=LLM_SYSTEM_PROMPT)
+            return response.strip()
+        except Exception as e:
+            log.error(f"LLM generation failed: {str(e)}")
+            return self._generate_with_template(query, positions, stock_symbol)
+    
+    def _build_llm_prompt(
+        self,
+        query: str,
+        positions: np.ndarray,
+        stock_symbol: Optional[str]
+    ) -> str:
+        """Build the per-query part of the analyst prompt (see LLM_SYSTEM_PROMPT)"""
+        texts = self._relevant_sentences(query, self._chunk_values(positions, 'page_content', ''))
+        
+        # Create context from the retrieved chunks
         context = "\n\n".join([
-            f"Source: {doc.metadata.get('source', 'Unknown')} ({doc.metadata.get('published_date', 'Unknown date')})\n"
-            f"Sentiment: {doc.metadata.get('sentiment_label', 'neutral')}\n"
-            f"Content: {doc.page_content}"
-            for doc in docs
+            f"Source: {source} ({published_date})\n"
+            f"Sentiment: {sentiment}\n"
+            f"Content: {text}"
+            for source, published_date, sentiment, text in zip(
+                self._chunk_values(positions, 'source', 'Unknown'),
+                self._chunk_values(positions, 'published_date', 'Unknown date'),
+                self._chunk_values(positions, 'sentiment_label', 'neutral'),
+                texts
+            )
+            if text
         ])
         
-        # Create prompt
-        prompt_template = """You are a financial risk analyst. Based on the following news articles, provide a clear and concise explanation.
-
-Stock: {stock_symbol}
-Question: {query}
-
-News Articles:
-{context}
-
-Provide a professional analysis that:
-1. Summarizes the key points from the news
-2. Explains the risk factors or opportunities
-3. Maintains objectivity and cites specific information
-4. Keeps the response under 200 words
-
-Analysis:"""
-        
-        prompt = prompt_template.format(
+        return LLM_USER_PROMPT.format(
             stock_symbol=stock_symbol or "General Market",
             query=query,
             context=context
         )
+    
+    def _relevant_sentences(self, query: str, texts: List[str]) -> List[str]:
+        """
+        Reduce chunk texts to their sentences most relevant to the query
         
-        try:
-            response = self.llm.invoke(prompt)
-            return response.strip()
-        except Exception as e:
-            log.error(f"LLM generation failed: {str(e)}")
-            return self._generate_with_template(query, docs, stock_symbol)
+        Sentences are scored by embedding similarity to the query (one encode
+        call for all of them). Repeated sentences and ones below
+        CONTEXT_MIN_SIMILARITY are dropped; the rest are kept best-first until
+        CONTEXT_MAX_CHARS is used, starting with each chunk's best sentence.
+        Kept sentences stay in their original order.
+        
+        Args:
+            query: User query
+            texts: Chunk texts, in rank order
+            
+        Returns:
+            Reduced text per chunk (empty if nothing was kept)
+        """
+        sentences = [_SENTENCE_BOUNDARY.split(text.strip()) if text else [] for text in texts]
+        flat = [sentence for chunk in sentences for sentence in chunk]
+        if not flat:
+            return list(texts)
+        
+        chunk_ids = np.repeat(np.arange(len(sentences)), [len(chunk) for chunk in sentences])
+        scores = self._embed_texts(flat) @ self._embed_queries([query])[0]
+        
+        # Each chunk's best sentence, in rank order
+        order = np.lexsort((-scores, chunk_ids))
+        chunk_best = order[np.r_[True, np.diff(chunk_ids[order]) != 0]]
+        is_best = np.zeros(len(flat), dtype=bool)
+        is_best[chunk_best] = True
+        
+        # Drop repeats (keeping the first) and weak matches
+        _, first = np.unique(np.array(flat, dtype=object), return_index=True)
+        candidates = np.zeros(len(flat), dtype=bool)
+        candidates[first] = True
+        candidates &= is_best | (scores >= CONTEXT_MIN_SIMILARITY)
+        
+        # Best sentences first, then the rest by score
+        by_score = np.argsort(-scores, kind='stable')
+        ranked = np.concatenate([chunk_best, by_score[~is_best[by_score]]])
+        ranked = ranked[candidates[ranked]]
+        
+        lengths = np.array([len(sentence) + 1 for sentence in flat])
+        kept = ranked[np.cumsum(lengths[ranked]) <= CONTEXT_MAX_CHARS]
+        
+        reduced = [[] for _ in texts]
+        for i in np.sort(kept):
+            reduced[chunk_ids[i]].append(flat[i])
+        
+        return [' '.join(chunk) for chunk in reduced]
     
     def _generate_with_template(
         self,
         query: str,
-        docs: List[Document],
+        positions: np.ndarray,
         stock_symbol: Optional[str]
     ) -> str:
         """
@@ -417,22 +1072,23 @@ Analysis:"""
         
         Args:
             query: User query
-            docs: Retrieved documents
+            positions: Index positions of the retrieved chunks
             stock_symbol: Stock symbol
             
         Returns:
             Template-based explanation
         """
-        # Count sentiment
-        sentiments = [doc.metadata.get('sentiment_label', 'neutral') for doc in docs]
-        positive = sentiments.count('positive')
-        negative = sentiments.count('negative')
-        neutral = sentiments.count('neutral')
+        # Count sentiment in one pass
+        sentiments = self._chunk_values(positions, 'sentiment_label', 'neutral').astype(str)
+        counts = dict(zip(*np.unique(sentiments, return_counts=True)))
+        positive = int(counts.get('positive', 0))
+        negative = int(counts.get('negative', 0))
+        neutral = int(counts.get('neutral', 0))
         
         # Build explanation
         symbol_text = f"for {stock_symbol}" if stock_symbol else ""
         
-        explanation = f"Based on {len(docs)} recent news articles {symbol_text}:\n\n"
+        explanation = f"Based on {len(positions)} recent news articles {symbol_text}:\n\n"
         
         if negative > positive:
             explanation += f"⚠️ **Negative sentiment detected** ({negative} negative articles):\n"
@@ -443,43 +1099,55 @@ Analysis:"""
         
         # Add key headlines
         explanation += "\nKey headlines:\n"
-        for i, doc in enumerate(docs[:3], 1):
-            headline = doc.metadata.get('headline', doc.page_content[:100])
-            sentiment = doc.metadata.get('sentiment_label', 'neutral')
+        top = positions[:3]
+        for i, (headline, text, sentiment) in enumerate(zip(
+            self._chunk_values(top, 'headline', None),
+            self._chunk_values(top, 'page_content', ''),
+            self._chunk_values(top, 'sentiment_label', 'neutral')
+        ), 1):
+            if headline is None:
+                headline = text[:100]
             explanation += f"{i}. [{sentiment.upper()}] {headline}\n"
         
         return explanation
     
-    def _extract_sources(self, docs: List[Document]) -> List[Dict]:
+    def _extract_sources(self, positions: np.ndarray) -> List[Dict]:
         """
-        Extract source information from documents
+        Extract source information from the retrieved chunks
         
         Args:
-            docs: List of documents
+            positions: Index positions of the retrieved chunks
             
         Returns:
             List of source dictionaries
         """
-        sources = []
-        seen_urls = set()
+        # First chunk of each URL, in rank order
+        urls = self._chunk_values(positions, 'url', '')
+        _, first = np.unique(urls.astype(str), return_index=True)
+        positions = positions[np.sort(first)]
         
-        for doc in docs:
-            url = doc.metadata.get('url', '')
-            
-            # Skip duplicates
-            if url in seen_urls:
-                continue
-            
-            seen_urls.add(url)
-            
-            sources.append({
-                'headline': doc.metadata.get('headline', ''),
-                'source': doc.metadata.get('source', 'Unknown'),
+        columns = zip(
+            self._chunk_values(positions, 'url', ''),
+            self._chunk_values(positions, 'headline', ''),
+            self._chunk_values(positions, 'source', 'Unknown'),
+            self._chunk_values(positions, 'published_date', ''),
+            self._chunk_values(positions, 'sentiment_label', 'neutral'),
+            self._chunk_values(positions, 'sentiment_score', 0.0),
+            self._chunk_values(positions, 'duplicate_urls', None)
+        )
+        
+        sources = [
+            {
+                'headline': headline,
+                'source': source,
                 'url': url,
-                'published_date': doc.metadata.get('published_date', ''),
-                'sentiment': doc.metadata.get('sentiment_label', 'neutral'),
-                'sentiment_score': doc.metadata.get('sentiment_score', 0.0)
-            })
+                'published_date': published_date,
+                'sentiment': sentiment,
+                'sentiment_score': sentiment_score,
+                'duplicate_urls': list(duplicate_urls) if duplicate_urls else []
+            }
+            for url, headline, source, published_date, sentiment, sentiment_score, duplicate_urls in columns
+        ]
         
         return sources
     
@@ -502,14 +1170,14 @@ Analysis:"""
             return None
         
         # Chunk documents
-        documents = self.chunk_documents(news_df)
+        texts, chunk_meta = self.chunk_documents(news_df)
         
-        if not documents:
+        if not texts:
             log.warning("No documents created")
             return None
         
         # Build vector store
-        self.vector_store = self.build_vector_store(documents)
+        self.vector_store = self.build_vector_store(texts, chunk_meta)
         
         # Save vector store
         if self.vector_store:
@@ -519,4 +1187,37 @@ Analysis:"""
         log.info("✓ RAG AGENT COMPLETED")
         log.info("=" * 60)
         
-        return self.vector_store
\ No newline at end of file
+        return self.vector_store
+
+# Process-wide RAG agent shared by the API and the alert agent
+_shared_agent = None
+_shared_agent_lock = threading.Lock()
+
+def get_shared_rag_agent() -> Optional[NewsRAGAgent]:
+    """
+    Get the process-wide RAG agent, loading the models and vector store once
+    
+    Returns:
+        Shared NewsRAGAgent, or None if initialization failed
+    """
+    global _shared_agent
+    
+    if _shared_agent is None:
+        with _shared_agent_lock:
+            if _shared_agent is None:
+                try:
+                    log.info("Initializing shared RAG agent...")
+                    agent = NewsRAGAgent()
+                    agent.vector_store = agent.load_vector_store()
+                    
+                    if agent.vector_store:
+                        log.info("✓ Shared RAG agent initialized")
+                    else:
+                        log.warning("RAG agent initialized but no vector store found")
+                    
+                    _shared_agent = agent
+                    
+                except Exception as e:
+                    log.error(f"Failed to initialize RAG agent: {str(e)}")
+    
+    return _shared_agent
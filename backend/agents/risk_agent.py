@@ -8,6 +8,103 @@ from backend.utils import log, load_config
 from backend.database import DatabaseService
 from datetime import datetime
 
+# Default component weights (overridden by agents.risk_scoring.weights)
+DEFAULT_WEIGHTS = {
+    'volatility': 0.4,
+    'drawdown': 0.3,
+    'sentiment': 0.2,
+    'liquidity': 0.1
+}
+
+# Normalized risk components, in weight order
+NORM_COLUMNS = ['norm_volatility', 'norm_drawdown', 'norm_sentiment', 'norm_liquidity']
+
+# Risk levels, and the default upper score bound of each level but the last
+# (overridden by agents.risk_scoring.thresholds)
+RISK_LEVELS = ['Low', 'Medium', 'High']
+RISK_LEVEL_BOUNDS = np.array([0.3, 0.6])
+
+# Working precision of the scoring block: components are normalized to
+# 0-1, so float32 is plenty and halves the bytes each pass touches
+RISK_DTYPE = np.float32
+
+# Risk drivers: (normalized component, threshold, label), one per
+# NORM_COLUMNS entry in the same order (also the display order)
+RISK_DRIVERS = [
+    ('norm_volatility', 0.7, "High volatility"),
+    ('norm_drawdown', 0.7, "Significant drawdown"),
+    ('norm_sentiment', 0.6, "Negative news sentiment"),
+    ('norm_liquidity', 0.6, "Liquidity concerns"),
+]
+DRIVER_THRESHOLDS = np.array([threshold for _, threshold, _ in RISK_DRIVERS], dtype=np.float32)
+
+# Drivers text for every driver bitmask (bit j = RISK_DRIVERS[j])
+RISK_DRIVER_LABELS = np.array([
+    " | ".join(label for j, (_, _, label) in enumerate(RISK_DRIVERS) if bits >> j & 1)
+    or "Stable metrics"
+    for bits in range(1 << len(RISK_DRIVERS))
+], dtype=object)
+
+def _score_rows_numpy(norm, weights, bounds, thresholds):
+    """
+    Score, level code and driver bitmask of each row of normalized components
+    
+    Args:
+        norm: (N, 4) normalized components in NORM_COLUMNS order
+        weights: Component weights
+        bounds: Upper score bound of each risk level but the last
+        thresholds: Driver threshold of each component
+        
+    Returns:
+        Tuple of (scores clipped to 0-1, level codes with -1 for NaN scores,
+        driver bitmasks with bit j set when component j exceeds its threshold)
+    """
+    scores = np.clip(norm @ weights, 0.0, 1.0)
+    
+    levels = np.searchsorted(bounds, scores, side='left')
+    levels[np.isnan(scores)] = -1
+    
+    bits = ((norm > thresholds) << np.arange(norm.shape[1])).sum(axis=1)
+    
+    return scores, levels, bits
+
+# Fused per-row kernel (one parallel pass) when numba is installed
+try:
+    import numba
+    
+    @numba.njit(nogil=True, parallel=True, cache=True)
+    def _score_rows(norm, weights, bounds, thresholds):
+        """Numba version of _score_rows_numpy"""
+        n, k = norm.shape
+        scores = np.empty_like(norm[:, 0])
+        levels = np.empty(n, dtype=np.int64)
+        bits = np.zeros(n, dtype=np.int64)
+        
+        for i in numba.prange(n):
+            score = 0.0
+            for j in range(k):
+                score += norm[i, j] * weights[j]
+                if norm[i, j] > thresholds[j]:
+                    bits[i] |= 1 << j
+            
+            if np.isnan(score):
+                scores[i] = score
+                levels[i] = -1
+                continue
+            
+            scores[i] = min(max(score, 0.0), 1.0)
+            score = scores[i]
+            
+            # Number of bounds below the score (bins are right-closed)
+            level = 0
+            while level < len(bounds) and bounds[level] < score:
+                level += 1
+            levels[i] = level
+        
+        return scores, levels, bits
+except ImportError:
+    _score_rows = _score_rows_numpy
+
 class RiskScoringAgent:
     """
     Agent responsible for computing composite risk scores.
@@ -18,12 +115,23 @@ class RiskScoringAgent:
         self.config = load_config()
         self.ml_scorer = None
         self._try_load_ml()
-        self.weights = {
-            'volatility': 0.4,
-            'drawdown': 0.3,
-            'sentiment': 0.2,
-            'liquidity': 0.1
-        }
+        
+        # Weights and level thresholds from config, precomputed as arrays
+        scoring_config = self.config.get('agents', {}).get('risk_scoring', {})
+        self.weights = {**DEFAULT_WEIGHTS, **scoring_config.get('weights', {})}
+        thresholds = scoring_config.get('thresholds', {})
+        
+        # Component weights in NORM_COLUMNS order, for the score matvec
+        self.weight_vector = np.array([
+            self.weights['volatility'],
+            self.weights['drawdown'],
+            self.weights['sentiment'],
+            self.weights['liquidity']
+        ], dtype=RISK_DTYPE)
+        self.level_bounds = np.array([
+            thresholds.get('low', RISK_LEVEL_BOUNDS[0]),
+            thresholds.get('medium', RISK_LEVEL_BOUNDS[1])
+        ], dtype=RISK_DTYPE)
     
     def _try_load_ml(self):
         """Try to load the ML risk scorer."""
@@ -36,7 +144,7 @@ class RiskScoringAgent:
                 log.info("ML model files not found — using manual formula")
                 self.ml_scorer = None
         except Exception as e:
-            log.warning(f"Could not load ML scorer: {e}")
+            log.warning("Could not load ML scorer: {}", e)
             self.ml_scorer = None
     
     def normalize_feature(self, series: pd.Series, inverse: bool = False) -> pd.Series:
@@ -51,7 +159,7 @@ class RiskScoringAgent:
         max_val = series.max()
         
         if max_val == min_val:
-            return pd.Series([0.5] * len(series), index=series.index)
+            return pd.Series(np.full(len(series), 0.5, dtype=RISK_DTYPE), index=series.index, name=series.name)
         
         normalized = (series - min_val) / (max_val - min_val)
         
@@ -60,6 +168,51 @@ class RiskScoringAgent:
         
         return normalized
     
+    def _normalize_block(self, values: np.ndarray, inverse: np.ndarray) -> np.ndarray:
+        """
+        Normalize each column of a feature block to 0-1 range
+        
+        Same rules as normalize_feature, for all columns at once: NaNs are
+        ignored for min/max and stay NaN, and a constant column becomes 0.5.
+        
+        Args:
+            values: Feature matrix, one column per feature
+            inverse: Per-column flags, True where higher values = lower risk
+        """
+        # The min/max reductions have no identity on zero rows
+        if len(values) == 0:
+            return values.copy()
+        
+        min_vals = np.fmin.reduce(values, axis=0)
+        max_vals = np.fmax.reduce(values, axis=0)
+        spans = max_vals - min_vals
+        constant = spans == 0
+        
+        normalized = (values - min_vals) / np.where(constant, 1, spans)
+        normalized = np.where(inverse, 1 - normalized, normalized)
+        normalized[:, constant] = 0.5
+        
+        return normalized
+    
+    def _rank_descending(self, scores: np.ndarray) -> np.ndarray:
+        """
+        Rank scores from highest (1) to lowest, tied scores sharing the lowest rank
+        
+        Same as Series.rank(ascending=False, method='min'), from one stable argsort.
+        """
+        order = np.argsort(-scores, kind='stable')
+        sorted_scores = scores[order]
+        
+        # Each run of equal scores takes the rank of its first position
+        positions = np.arange(len(scores))
+        run_start = np.ones(len(scores), dtype=bool)
+        run_start[1:] = sorted_scores[1:] != sorted_scores[:-1]
+        
+        ranks = np.empty(len(scores), dtype=np.int64)
+        ranks[order] = np.maximum.accumulate(np.where(run_start, positions, 0)) + 1
+        
+        return ranks
+    
     def compute_risk_score(self, df: pd.DataFrame) -> pd.DataFrame:
         """
         Compute composite risk score
@@ -74,60 +227,74 @@ class RiskScoringAgent:
         
         df = df.copy()
         
-        # Normalize components
-        df['norm_volatility'] = self.normalize_feature(df['volatility_21d'])
-        df['norm_drawdown'] = self.normalize_feature(df['max_drawdown'].abs())
-        df['norm_sentiment'] = self.normalize_feature(df['avg_sentiment'], inverse=True)
-        df['norm_liquidity'] = self.normalize_feature(df['liquidity_risk'])
-        
-        # Handle NaN values
-        df['norm_volatility'] = df['norm_volatility'].fillna(0.5)
-        df['norm_drawdown'] = df['norm_drawdown'].fillna(0.5)
-        df['norm_sentiment'] = df['norm_sentiment'].fillna(0.5)
-        df['norm_liquidity'] = df['norm_liquidity'].fillna(0.5)
-        
-        # Compute weighted risk score
-        df['risk_score'] = (
-            df['norm_volatility'] * self.weights['volatility'] +
-            df['norm_drawdown'] * self.weights['drawdown'] +
-            df['norm_sentiment'] * self.weights['sentiment'] +
-            df['norm_liquidity'] * self.weights['liquidity']
-        )
+        # Normalize components in one pass over a (N, 4) block
+        components = np.column_stack([
+            df['volatility_21d'].to_numpy(dtype=RISK_DTYPE),
+            np.abs(df['max_drawdown'].to_numpy(dtype=RISK_DTYPE)),
+            df['avg_sentiment'].to_numpy(dtype=RISK_DTYPE),
+            df['liquidity_risk'].to_numpy(dtype=RISK_DTYPE)
+        ])
+        normalized = self._normalize_block(components, inverse=np.array([False, False, True, False]))
         
-        # Classify risk level
-        df['risk_level'] = pd.cut(
-            df['risk_score'],
-            bins=[0, 0.3, 0.6, 1.0],
-            labels=['Low', 'Medium', 'High']
+        # Handle NaN values in place on the block, before it goes into the frame
+        normalized[np.isnan(normalized)] = 0.5
+        df[NORM_COLUMNS] = normalized
+        
+        # Weighted score, risk level and drivers in one pass over the rows
+        scores, level_codes, driver_bits = _score_rows(
+            np.ascontiguousarray(normalized),
+            self.weight_vector,
+            self.level_bounds,
+            DRIVER_THRESHOLDS
         )
+        df['risk_score'] = scores
+        df['risk_level'] = pd.Categorical.from_codes(level_codes, categories=RISK_LEVELS, ordered=True)
+        
+        level_counts = np.bincount(level_codes[level_codes >= 0], minlength=len(RISK_LEVELS))
+        log.opt(lazy=True).info("Risk levels: {}", lambda: ", ".join(
+            f"{level}={count}" for level, count in zip(RISK_LEVELS, level_counts)
+        ))
         
         # Rank stocks by risk
-        df['risk_rank'] = df['risk_score'].rank(ascending=False, method='min').astype(int)
+        df['risk_rank'] = self._rank_descending(scores)
         
         # Generate risk drivers explanation
-        df['risk_drivers'] = df.apply(self._generate_risk_drivers, axis=1)
+        df['risk_drivers'] = self._generate_risk_drivers(driver_bits)
         
-        log.info(f"✓ Computed risk scores for {len(df)} stocks")
+        log.info("✓ Computed risk scores for {} stocks", len(df))
         
         return df
     
-    def _generate_risk_drivers(self, row) -> str:
-        """Generate human-readable risk drivers"""
-        drivers = []
+    def _generate_risk_drivers(self, driver_bits: np.ndarray) -> np.ndarray:
+        """
+        Generate human-readable risk drivers for all rows at once
         
-        if row['norm_volatility'] > 0.7:
-            drivers.append("High volatility")
-        if row['norm_drawdown'] > 0.7:
-            drivers.append("Significant drawdown")
-        if row['norm_sentiment'] > 0.6:
-            drivers.append("Negative news sentiment")
-        if row['norm_liquidity'] > 0.6:
-            drivers.append("Liquidity concerns")
+        Bit j of each row's mask marks driver j of RISK_DRIVERS, so the mask
+        indexes straight into the precomputed RISK_DRIVER_LABELS.
+        """
+        return RISK_DRIVER_LABELS[driver_bits]
+    
+    def _mean_by_symbol(self, df: pd.DataFrame, column: str) -> pd.DataFrame:
+        """
+        Per-symbol mean of a numeric column
         
-        if not drivers:
-            drivers.append("Stable metrics")
+        Same result as groupby('stock_symbol').mean() (NaN keys and values
+        skipped), via one factorize and two bincounts.
         
-        return " | ".join(drivers)
+        Returns:
+            DataFrame with stock_symbol and the averaged column
+        """
+        codes, symbols = pd.factorize(df['stock_symbol'])
+        values = df[column].to_numpy(dtype=float)
+        
+        valid = (codes >= 0) & ~np.isnan(values)
+        sums = np.bincount(codes[valid], weights=values[valid], minlength=len(symbols))
+        counts = np.bincount(codes[valid], minlength=len(symbols))
+        
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = sums / counts
+        
+        return pd.DataFrame({'stock_symbol': symbols, column: means})
     
     def process(self):
         """
@@ -172,29 +339,22 @@ class RiskScoringAgent:
                 db.save_risk_history(result_df[['symbol', 'risk_score', 'risk_level']])
                 log.info("Risk history updated")
             except Exception as e:
-                log.warning(f"Could not save risk history: {e}")
+                log.warning("Could not save risk history: {}", e)
             
             log.info("=" * 60)
-            log.info(f"ML RISK SCORING COMPLETE — {len(result_df)} stocks scored")
+            log.info("ML RISK SCORING COMPLETE — {} stocks scored", len(result_df))
             log.info("=" * 60)
             
             return result_df
             
         except Exception as e:
-            log.error(f"ML scoring failed: {e}")
+            log.error("ML scoring failed: {}", e)
             import traceback
             traceback.print_exc()
             return self._process_manual(db)
     
     def _process_manual(self, db):
         """Fallback: manual weighted formula risk scoring."""
-        log.info("Loading market features from database...")
-        market_data = db.get_market_data(days=365)
-        
-        if market_data.empty:
-            log.error("No market data found!")
-            return None
-        
         log.info("Loading latest risk scores...")
         risk_scores = db.get_latest_risk_scores()
         
@@ -206,9 +366,7 @@ class RiskScoringAgent:
         sentiment_data = db.get_recent_sentiment(days=7)
         
         if not sentiment_data.empty:
-            sentiment_avg = sentiment_data.groupby('stock_symbol').agg({
-                'avg_sentiment': 'mean'
-            }).reset_index()
+            sentiment_avg = self._mean_by_symbol(sentiment_data, 'avg_sentiment')
             risk_scores = risk_scores.merge(
                 sentiment_avg, left_on='symbol', right_on='stock_symbol', how='left'
             )
@@ -218,14 +376,14 @@ class RiskScoringAgent:
         
         risk_scores['Date'] = datetime.now().date()
         
-        log.info(f"Found {len(risk_scores)} stocks with risk scores")
+        log.info("Found {} stocks with risk scores", len(risk_scores))
         
         db.save_risk_scores(risk_scores)
         
         try:
             db.save_risk_history(risk_scores[['symbol', 'risk_score', 'risk_level']])
         except Exception as e:
-            log.warning(f"Could not save risk history: {e}")
+            log.warning("Could not save risk history: {}", e)
         
         log.info("✓ MANUAL RISK SCORING COMPLETED")
         
@@ -2,20 +2,69 @@
 Sentiment Agent - Analyze news sentiment using FinBERT
 Now analyzes full article content instead of just headlines
 """
+import os
+import hashlib
 import torch
-from transformers import BertTokenizer, BertForSequenceClassification
+from transformers import BertTokenizerFast, BertForSequenceClassification
 import pandas as pd
+from typing import List, Optional
 from datetime import datetime, timedelta
-from backend.utils import log
+from sqlalchemy import Date, cast, func, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from backend.utils import log, load_config, TTLCache
 from backend.database import DatabaseService
 from backend.database.models import NewsArticle, SentimentScore
 
+# ONNX Runtime backend (optional, needs optimum[onnxruntime])
+try:
+    from optimum.onnxruntime import ORTModelForSequenceClassification
+except ImportError:
+    ORTModelForSequenceClassification = None
+
+# Exported ONNX FinBERT, written on first use of the onnx backend
+ONNX_MODEL_DIR = os.path.join(os.path.dirname(__file__), '..', 'models', 'finbert_onnx')
+
+# FinBERT output classes, in logit order
+SENTIMENT_LABELS = ['positive', 'negative', 'neutral']
+
+# Weight dtypes by `dtype` setting ('auto': float16 on GPU, int8 on CPU);
+# 'int8' is dynamic quantization of the Linear layers, CPU only
+MODEL_DTYPES = {
+    'float32': torch.float32,
+    'float16': torch.float16,
+    'bfloat16': torch.bfloat16,
+    'int8': torch.qint8
+}
+
+# Scored texts kept per agent (least recently used evicted first)
+SENTIMENT_CACHE_SIZE = 100_000
+
+# Result for texts too short to analyze (or that failed)
+NEUTRAL_SENTIMENT = {
+    'label': 'neutral',
+    'score': 0.0,
+    'confidence': 0.0
+}
+
 class SentimentAgent:
     """
     Analyze news sentiment with FinBERT using full article content
     """
     
     def __init__(self):
+        self.config = load_config()
+        self.agent_config = self.config['agents']['sentiment']
+        
+        # Texts per FinBERT forward pass
+        self.batch_size = self.agent_config.get('batch_size', 16)
+        
+        # Score headline and content separately and blend them (two passes
+        # per article) instead of one pass over both
+        self.dual_pass = self.agent_config.get('dual_pass', False)
+        
+        # Text key -> sentiment; the model is fixed, so entries never go stale
+        self._sentiment_cache = TTLCache(maxsize=SENTIMENT_CACHE_SIZE, ttl=float('inf'))
+        
         self.model = None
         self.tokenizer = None
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
@@ -27,17 +76,116 @@ class SentimentAgent:
             log.info(f"Loading FinBERT model on {self.device}...")
             
             model_name = "ProsusAI/finbert"
-            self.tokenizer = BertTokenizer.from_pretrained(model_name)
+            self.tokenizer = BertTokenizerFast.from_pretrained(model_name)
+            
+            if self.agent_config.get('backend', 'torch') == 'onnx' and self._load_onnx_model(model_name):
+                log.info("✓ FinBERT model loaded successfully (ONNX Runtime)")
+                return
+            
             self.model = BertForSequenceClassification.from_pretrained(model_name)
             self.model.to(self.device)
             self.model.eval()
             
+            dtype = self._set_model_dtype()
+            
+            # Optional graph compilation (kernel fusion); dynamic shapes avoid
+            # a recompile per width. Compilation is lazy, so a warmup forward
+            # surfaces failures here and keeps the eager model instead
+            if self.agent_config.get('compile', False):
+                if dtype == 'int8':
+                    log.warning("torch.compile is not supported with int8 weights, running eager")
+                else:
+                    try:
+                        compiled = torch.compile(self.model, dynamic=True)
+                        warmup = self.tokenizer(["warmup"], return_tensors="pt").to(self.device)
+                        with torch.no_grad():
+                            compiled(**warmup)
+                        self.model = compiled
+                        log.info("FinBERT compiled with torch.compile")
+                    except Exception as e:
+                        log.warning(f"torch.compile unavailable, running eager: {str(e)}")
+            
             log.info("✓ FinBERT model loaded successfully")
             
         except Exception as e:
             log.error(f"Error loading FinBERT model: {str(e)}")
             raise
     
+    def _load_onnx_model(self, model_name: str) -> bool:
+        """
+        Load FinBERT on ONNX Runtime, exporting it once on first use
+        
+        Returns:
+            True if the ONNX model is loaded, False to fall back to PyTorch
+        """
+        if ORTModelForSequenceClassification is None:
+            log.warning("optimum[onnxruntime] not installed, using PyTorch")
+            return False
+        
+        provider = 'CUDAExecutionProvider' if self.device.type == 'cuda' else 'CPUExecutionProvider'
+        
+        try:
+            if os.path.isdir(ONNX_MODEL_DIR):
+                self.model = ORTModelForSequenceClassification.from_pretrained(
+                    ONNX_MODEL_DIR, provider=provider
+                )
+            else:
+                self.model = ORTModelForSequenceClassification.from_pretrained(
+                    model_name, export=True, provider=provider
+                )
+                
+                # Write next to the final path, then rename, so an interrupted
+                # export never leaves a half-written model behind
+                tmp_dir = ONNX_MODEL_DIR + '.tmp'
+                self.model.save_pretrained(tmp_dir)
+                os.replace(tmp_dir, ONNX_MODEL_DIR)
+                log.info(f"FinBERT exported to ONNX at {ONNX_MODEL_DIR}")
+            
+            return True
+            
+        except Exception as e:
+            log.warning(f"ONNX Runtime unavailable, using PyTorch: {str(e)}")
+            return False
+    
+    def _set_model_dtype(self):
+        """
+        Cast FinBERT weights to the configured inference precision
+        
+        float16 halves memory traffic on the GPU (tensor cores); int8 runs
+        the Linear layers as quantized GEMMs on the CPU (VNNI); bfloat16
+        speeds up CPUs with AVX512-BF16/AMX. Logits are upcast to float32
+        before the softmax either way.
+        
+        Returns:
+            The dtype name actually applied
+        """
+        on_gpu = self.device.type == 'cuda'
+        
+        dtype = self.agent_config.get('dtype', 'auto')
+        if dtype == 'auto':
+            dtype = 'float16' if on_gpu else 'int8'
+        
+        if dtype not in MODEL_DTYPES:
+            log.warning(f"Unknown sentiment dtype '{dtype}', using float32")
+            dtype = 'float32'
+        elif dtype == 'float16' and not on_gpu:
+            log.warning("float16 inference needs a GPU, using float32")
+            dtype = 'float32'
+        elif dtype == 'int8' and on_gpu:
+            log.warning("int8 inference is CPU only, using float32")
+            dtype = 'float32'
+        
+        if dtype == 'int8':
+            self.model = torch.ao.quantization.quantize_dynamic(
+                self.model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+            log.info("FinBERT Linear layers quantized to int8")
+        elif dtype != 'float32':
+            self.model.to(MODEL_DTYPES[dtype])
+            log.info(f"FinBERT weights cast to {dtype}")
+        
+        return dtype
+    
     def analyze_text(self, text: str, max_length: int = 512) -> dict:
         """
         Analyze sentiment of text using FinBERT
@@ -49,120 +197,230 @@ class SentimentAgent:
         Returns:
             dict with label, score, confidence
         """
-        if not text or len(text.strip()) < 10:
-            return {
-                'label': 'neutral',
-                'score': 0.0,
-                'confidence': 0.0
-            }
+        return self.analyze_texts([text], max_length=max_length)[0]
+    
+    def analyze_texts(self, texts: List[str], max_length: int = 512) -> List[dict]:
+        """
+        Analyze sentiment of many texts, batch_size texts per forward pass
+        
+        Args:
+            texts: Texts to analyze (headlines and/or full content)
+            max_length: Max tokens (FinBERT limit is 512)
+        
+        Returns:
+            List of dicts with label, score, confidence, in input order
+        """
+        results = [dict(NEUTRAL_SENTIMENT) for _ in texts]
+        
+        # Texts too short to carry sentiment stay neutral
+        positions = [i for i, text in enumerate(texts) if text and len(text.strip()) >= 10]
+        if not positions:
+            return results
+        
+        # Truncate if too long (take first max_length tokens worth of text)
+        # Roughly 4 chars per token
+        truncated = {i: texts[i][:max_length * 4] for i in positions}
+        text_keys = {i: self._text_key(truncated[i], max_length) for i in positions}
+        
+        # Texts scored before (e.g. repeated wire headlines) come from the
+        # cache, and each distinct text in this call is scored only once
+        scored = {}
+        for text_key in text_keys.values():
+            cached = self._sentiment_cache.get(text_key)
+            if cached is not None:
+                scored[text_key] = cached
+        
+        pending = list({
+            text_key: truncated[i] for i, text_key in text_keys.items() if text_key not in scored
+        }.items())
+        
+        if pending:
+            self._score_texts(pending, max_length, scored)
+        
+        for i, text_key in text_keys.items():
+            if text_key in scored:
+                results[i] = dict(scored[text_key])
+        
+        return results
+    
+    def _text_key(self, text: str, max_length: int) -> bytes:
+        """
+        Cache key of a (truncated) text
+        
+        FinBERT's tokenizer is uncased and splits on whitespace, so case and
+        spacing differences map to the same key; hashing keeps keys small.
+        """
+        normalized = ' '.join(text.split()).lower()
+        return hashlib.blake2b(f"{max_length}:{normalized}".encode(), digest_size=16).digest()
+    
+    def _score_texts(self, pending: List[tuple], max_length: int, scored: dict):
+        """
+        Run FinBERT over (text key, text) pairs, batch_size texts per pass
         
+        Results are stored in scored and the sentiment cache by text key;
+        texts in a failed batch are left out (neutral).
+        """
         try:
-            # Truncate if too long (take first max_length tokens worth of text)
-            # Roughly 4 chars per token
-            if len(text) > max_length * 4:
-                text = text[:max_length * 4]
-            
-            # Tokenize
-            inputs = self.tokenizer(
-                text,
-                return_tensors="pt",
+            # Tokenize once up front
+            encodings = self.tokenizer(
+                [text for _, text in pending],
                 truncation=True,
-                max_length=max_length,
-                padding=True
-            ).to(self.device)
-            
-            # Get prediction
-            with torch.no_grad():
-                outputs = self.model(**inputs)
-                predictions = torch.nn.functional.softmax(outputs.logits, dim=-1)
-            
-            # Get label and confidence
-            confidence, predicted_class = torch.max(predictions, dim=1)
-            
-            labels = ['positive', 'negative', 'neutral']
-            sentiment_label = labels[predicted_class.item()]
-            
-            # Convert to score (-1 to 1)
-            if sentiment_label == 'positive':
-                sentiment_score = predictions[0][0].item()
-            elif sentiment_label == 'negative':
-                sentiment_score = -predictions[0][1].item()
-            else:
-                sentiment_score = 0.0
-            
-            return {
-                'label': sentiment_label,
-                'score': sentiment_score,
-                'confidence': confidence.item()
-            }
-            
+                max_length=max_length
+            )
         except Exception as e:
             log.error(f"Error analyzing sentiment: {str(e)}")
-            return {
-                'label': 'neutral',
-                'score': 0.0,
-                'confidence': 0.0
-            }
+            return
+        
+        # Batch texts of similar length together, so a short headline is
+        # not padded to the length of a full article in the same batch
+        order = sorted(range(len(pending)), key=lambda k: len(encodings['input_ids'][k]))
+        
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            
+            try:
+                batch_inputs = self.tokenizer.pad(
+                    {key: [encodings[key][k] for k in batch] for key in encodings.keys()},
+                    return_tensors="pt"
+                )
+                
+                # On the GPU, copy from pinned memory without blocking the host
+                on_gpu = self.device.type == 'cuda'
+                inputs = {
+                    key: (tensor.pin_memory() if on_gpu else tensor).to(self.device, non_blocking=on_gpu)
+                    for key, tensor in batch_inputs.items()
+                }
+                
+                # Get predictions for the whole batch
+                with torch.no_grad():
+                    logits = self.model(**inputs).logits.float()
+                
+                # The label is the argmax of the logits (softmax keeps the
+                # order); only the winning class's probability is needed
+                predicted_class = logits.argmax(dim=-1)
+                confidence = torch.softmax(logits, dim=-1).gather(1, predicted_class[:, None]).squeeze(1)
+                
+                # Convert to score (-1 to 1) on the device: the winning class's
+                # probability, signed by its direction (SENTIMENT_LABELS order)
+                scores = torch.where(
+                    predicted_class == 0,
+                    confidence,
+                    torch.where(predicted_class == 1, -confidence, torch.zeros_like(confidence))
+                )
+                
+                # Classes, confidences and scores in one copy to the CPU
+                batch_rows = torch.stack([predicted_class.float(), confidence, scores], dim=1).tolist()
+                
+            except Exception as e:
+                log.error(f"Error analyzing sentiment: {str(e)}")
+                continue
+            
+            for k, (label_index, label_confidence, sentiment_score) in zip(batch, batch_rows):
+                sentiment_label = SENTIMENT_LABELS[int(label_index)]
+                
+                text_key = pending[k][0]
+                scored[text_key] = {
+                    'label': sentiment_label,
+                    'score': sentiment_score,
+                    'confidence': label_confidence
+                }
+                self._sentiment_cache.set(text_key, scored[text_key])
     
     def analyze_article_enhanced(self, article: NewsArticle) -> dict:
         """
         Enhanced sentiment analysis using BOTH headline and full content
         
-        Weights:
+        One FinBERT pass over the headline followed by the content, or with
+        `dual_pass` set, separate passes blended with weights:
         - Headline: 40% (more impactful, what people read first)
         - Content: 60% (more comprehensive, full context)
         """
-        try:
-            # Analyze headline
-            headline_sentiment = self.analyze_text(article.headline)
+        return self.analyze_articles([article])[0]
+    
+    def analyze_articles(self, articles: List[NewsArticle]) -> List[dict]:
+        """
+        Enhanced sentiment analysis of many articles at once
+        
+        All headlines and contents go through analyze_texts as one list, so
+        FinBERT runs on full batches instead of one text at a time.
+        """
+        # Content is only scored when there is enough of it
+        has_content = [bool(article.content) and len(article.content) > 100 for article in articles]
+        
+        if not self.dual_pass:
+            return self._analyze_articles_joined(articles, has_content)
+        
+        texts = [article.headline for article in articles]
+        texts += [article.content for article, ok in zip(articles, has_content) if ok]
+        sentiments = self.analyze_texts(texts)
+        
+        content_sentiments = iter(sentiments[len(articles):])
+        results = []
+        
+        for article, headline_sentiment, ok in zip(articles, sentiments, has_content):
+            log.info(f"\nAnalyzing: {(article.headline or '')[:60]}...")
+            content_sentiment = next(content_sentiments) if ok else None
+            results.append(self._combine_sentiment(headline_sentiment, content_sentiment))
+        
+        return results
+    
+    def _analyze_articles_joined(self, articles: List[NewsArticle], has_content: List[bool]) -> List[dict]:
+        """
+        One FinBERT pass per article over the headline followed by the content
+        
+        The headline leads the text so it always survives truncation; the
+        content fills the rest of the 512-token window.
+        """
+        texts = [
+            f"{article.headline or ''} {article.content}" if ok else article.headline
+            for article, ok in zip(articles, has_content)
+        ]
+        results = self.analyze_texts(texts)
+        
+        for article, result in zip(articles, results):
+            log.info(f"\nAnalyzing: {(article.headline or '')[:60]}...")
+            log.info(f"  Headline + content: {result['label']} ({result['score']:.3f})")
+        
+        return results
+    
+    def _combine_sentiment(self, headline_sentiment: dict, content_sentiment: Optional[dict]) -> dict:
+        """Weight headline (40%) and content (60%) sentiment into one result"""
+        if content_sentiment is not None:
+            # Weighted average
+            final_score = (
+                headline_sentiment['score'] * 0.4 +
+                content_sentiment['score'] * 0.6
+            )
+            final_confidence = (
+                headline_sentiment['confidence'] * 0.4 +
+                content_sentiment['confidence'] * 0.6
+            )
             
-            # Analyze full content (if available)
-            if article.content and len(article.content) > 100:
-                content_sentiment = self.analyze_text(article.content, max_length=512)
-                
-                # Weighted average
-                final_score = (
-                    headline_sentiment['score'] * 0.4 +
-                    content_sentiment['score'] * 0.6
-                )
-                final_confidence = (
-                    headline_sentiment['confidence'] * 0.4 +
-                    content_sentiment['confidence'] * 0.6
-                )
-                
-                # Determine final label
-                if final_score > 0.1:
-                    final_label = 'positive'
-                elif final_score < -0.1:
-                    final_label = 'negative'
-                else:
-                    final_label = 'neutral'
-                
-                log.info(f"  Headline: {headline_sentiment['label']} ({headline_sentiment['score']:.3f})")
-                log.info(f"  Content: {content_sentiment['label']} ({content_sentiment['score']:.3f})")
-                log.info(f"  Final: {final_label} ({final_score:.3f})")
-                
+            # Determine final label
+            if final_score > 0.1:
+                final_label = 'positive'
+            elif final_score < -0.1:
+                final_label = 'negative'
             else:
-                # No content, use headline only
-                final_label = headline_sentiment['label']
-                final_score = headline_sentiment['score']
-                final_confidence = headline_sentiment['confidence']
-                
-                log.info(f"  Headline only: {final_label} ({final_score:.3f})")
+                final_label = 'neutral'
             
-            return {
-                'label': final_label,
-                'score': final_score,
-                'confidence': final_confidence
-            }
+            log.info(f"  Headline: {headline_sentiment['label']} ({headline_sentiment['score']:.3f})")
+            log.info(f"  Content: {content_sentiment['label']} ({content_sentiment['score']:.3f})")
+            log.info(f"  Final: {final_label} ({final_score:.3f})")
             
-        except Exception as e:
-            log.error(f"Error in enhanced analysis: {str(e)}")
-            return headline_sentiment if 'headline_sentiment' in locals() else {
-                'label': 'neutral',
-                'score': 0.0,
-                'confidence': 0.0
-            }
+        else:
+            # No content, use headline only
+            final_label = headline_sentiment['label']
+            final_score = headline_sentiment['score']
+            final_confidence = headline_sentiment['confidence']
+            
+            log.info(f"  Headline only: {final_label} ({final_score:.3f})")
+        
+        return {
+            'label': final_label,
+            'score': final_score,
+            'confidence': final_confidence
+        }
     
     def process(self):
         """
@@ -170,13 +428,21 @@ class SentimentAgent:
         """
         log.info("=" * 60)
         log.info("SENTIMENT AGENT - Analyzing News Sentiment")
-        log.info("Using enhanced analysis: Headline (40%) + Content (60%)")
+        if self.dual_pass:
+            log.info("Using enhanced analysis: Headline (40%) + Content (60%)")
+        else:
+            log.info("Using enhanced analysis: Headline + Content in one pass")
         log.info("=" * 60)
         
         try:
             with DatabaseService() as db:
-                # Get articles without sentiment
-                new_articles = db.db.query(NewsArticle).filter(
+                # Get articles without sentiment (only the columns analysis
+                # needs, so rows don't hydrate ORM objects)
+                new_articles = db.db.query(
+                    NewsArticle.id,
+                    NewsArticle.headline,
+                    NewsArticle.content
+                ).filter(
                     NewsArticle.sentiment_label == None
                 ).all()
                 
@@ -191,25 +457,21 @@ class SentimentAgent:
                 log.info(f"Found {len(new_articles)} articles without sentiment")
                 log.info(f"Analyzing {len(new_articles)} new articles...")
                 
-                analyzed_count = 0
+                # Enhanced analysis, batched across all articles
+                results = self.analyze_articles(new_articles)
                 
-                for article in new_articles:
-                    try:
-                        log.info(f"\nAnalyzing: {article.headline[:60]}...")
-                        
-                        # Enhanced analysis
-                        result = self.analyze_article_enhanced(article)
-                        
-                        # Update article
-                        article.sentiment_label = result['label']
-                        article.sentiment_score = result['score']
-                        article.sentiment_confidence = result['confidence']
-                        
-                        analyzed_count += 1
-                        
-                    except Exception as e:
-                        log.error(f"Error analyzing article {article.id}: {str(e)}")
-                        continue
+                # Update all articles with one executemany UPDATE by id
+                updates = [
+                    {
+                        'id': article.id,
+                        'sentiment_label': result['label'],
+                        'sentiment_score': result['score'],
+                        'sentiment_confidence': result['confidence']
+                    }
+                    for article, result in zip(new_articles, results)
+                ]
+                db.db.execute(update(NewsArticle), updates)
+                analyzed_count = len(updates)
                 
                 # Commit all updates
                 db.db.commit()
@@ -238,50 +500,55 @@ class SentimentAgent:
         log.info("\nAggregating daily sentiment scores...")
         
         try:
-            # Get all articles with sentiment
-            articles = db.db.query(NewsArticle).filter(
-                NewsArticle.sentiment_label != None
-            ).all()
+            # Group by stock and date in the database
+            day = cast(NewsArticle.published_date, Date)
+            groups = db.db.query(
+                NewsArticle.stock_id,
+                day,
+                func.sum(NewsArticle.sentiment_score),
+                func.count(NewsArticle.sentiment_score),
+                func.count()
+            ).filter(
+                NewsArticle.sentiment_label != None,
+                NewsArticle.stock_id != None
+            ).group_by(NewsArticle.stock_id, day).all()
             
-            # Group by stock and date
+            # Undated articles count towards today (merged with today's group)
             sentiment_by_stock_date = {}
+            today = datetime.now().date()
             
-            for article in articles:
-                if not article.stock_id:
-                    continue
-                
-                date = article.published_date.date() if article.published_date else datetime.now().date()
-                key = (article.stock_id, date)
-                
-                if key not in sentiment_by_stock_date:
-                    sentiment_by_stock_date[key] = []
-                
-                sentiment_by_stock_date[key].append(article.sentiment_score)
+            for stock_id, date, score_sum, score_count, article_count in groups:
+                key = (stock_id, date or today)
+                totals = sentiment_by_stock_date.get(key, (0, 0, 0))
+                sentiment_by_stock_date[key] = (
+                    totals[0] + (score_sum or 0),
+                    totals[1] + score_count,
+                    totals[2] + article_count
+                )
             
-            # Calculate averages and save
-            saved_count = 0
+            rows = [
+                {
+                    'stock_id': stock_id,
+                    'date': date,
+                    'avg_sentiment': score_sum / score_count if score_count else None,
+                    'article_count': article_count
+                }
+                for (stock_id, date), (score_sum, score_count, article_count)
+                in sentiment_by_stock_date.items()
+            ]
             
-            for (stock_id, date), scores in sentiment_by_stock_date.items():
-                avg_sentiment = sum(scores) / len(scores)
-                
-                # Check if exists
-                existing = db.db.query(SentimentScore).filter(
-                    SentimentScore.stock_id == stock_id,
-                    SentimentScore.date == date
-                ).first()
-                
-                if existing:
-                    existing.avg_sentiment = avg_sentiment
-                    existing.article_count = len(scores)
-                else:
-                    sentiment_score = SentimentScore(
-                        stock_id=stock_id,
-                        date=date,
-                        avg_sentiment=avg_sentiment,
-                        article_count=len(scores)
-                    )
-                    db.db.add(sentiment_score)
-                    saved_count += 1
+            if rows:
+                # One upsert on (stock_id, date): existing days get the new
+                # average and count, new days are inserted
+                stmt = pg_insert(SentimentScore)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=['stock_id', 'date'],
+                    set_={
+                        'avg_sentiment': stmt.excluded.avg_sentiment,
+                        'article_count': stmt.excluded.article_count
+                    }
+                )
+                db.db.execute(stmt, rows)
             
             db.db.commit()
             log.info(f"✓ Aggregated sentiment for {len(sentiment_by_stock_date)} stock-date combinations")
@@ -4,35 +4,15 @@ API Routes - Now using PostgreSQL
 from flask import Blueprint, jsonify, request
 from backend.utils import log
 from backend.database import DatabaseService
-from backend.agents.rag_agent import NewsRAGAgent
+from backend.agents.rag_agent import get_shared_rag_agent
 from datetime import datetime, timedelta, date
 import pandas as pd
 
 api_bp = Blueprint('api', __name__)
 
-# Global RAG agent (lazy loaded)
-_rag_agent = None
-
 def get_rag_agent():
     """Get or initialize RAG agent"""
-    global _rag_agent
-    
-    if _rag_agent is None:
-        try:
-            log.info("Initializing RAG agent for API...")
-            _rag_agent = NewsRAGAgent()
-            _rag_agent.vector_store = _rag_agent.load_vector_store()
-            
-            if _rag_agent.vector_store:
-                log.info(f"RAG agent initialized successfully")
-            else:
-                log.warning("RAG agent initialized but no vector store found")
-                
-        except Exception as e:
-            log.error(f"Failed to initialize RAG agent: {str(e)}")
-            _rag_agent = None
-    
-    return _rag_agent
+    return get_shared_rag_agent()
 
 @api_bp.route('/health', methods=['GET'])
 def health_check():
@@ -79,15 +59,13 @@ def get_risk_scores():
         limit = request.args.get('limit', type=int)
         
         with DatabaseService() as db:
-            risk_scores = db.get_latest_risk_scores()
+            # Filter by risk level in the database query
+            risk_scores = db.get_latest_risk_scores(risk_level=risk_level)
             
-            if risk_scores.empty:
+            # No data at all is a 404; a level filter matching nothing is an empty list
+            if risk_scores.empty and (not risk_level or not db.has_risk_scores()):
                 return jsonify({'error': 'No data available'}), 404
             
-            # Filter by risk level
-            if risk_level:
-                risk_scores = risk_scores[risk_scores['risk_level'] == risk_level]
-            
             # Limit results
             if limit:
                 risk_scores = risk_scores.head(limit)
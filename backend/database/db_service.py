@@ -3,7 +3,8 @@ Database Service Layer - Helper functions for common DB operations
 """
 from typing import List, Optional, Dict
 from datetime import datetime, date, timedelta
-from sqlalchemy import desc, func
+from sqlalchemy import desc, func, insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
 from backend.database.models import (
     SessionLocal, Stock, MarketData, RiskScore, NewsArticle,
@@ -47,6 +48,13 @@ class DatabaseService:
         stocks = self.get_all_stocks(active_only)
         return [stock.symbol for stock in stocks]
     
+    def get_stock_id_map(self, symbols: List[str] = None) -> Dict[str, int]:
+        """Get symbol -> stock id mapping in a single query"""
+        query = self.db.query(Stock.symbol, Stock.id)
+        if symbols is not None:
+            query = query.filter(Stock.symbol.in_(set(symbols)))
+        return {symbol: stock_id for symbol, stock_id in query.all()}
+    
     # ==================== MARKET DATA OPERATIONS ====================
     
     def save_market_data(self, data: pd.DataFrame, upsert: bool = True):
@@ -100,18 +108,31 @@ class DatabaseService:
         self.db.commit()
         log.info(f"✓ Saved {saved_count} new records, updated {updated_count} records")
     
-    def get_market_data(self, symbol: str = None, days: int = 365) -> pd.DataFrame:
+    def get_market_data(self, symbol: str = None, days: int = 365,
+                        symbols: List[str] = None) -> pd.DataFrame:
         """
         Get market data from database
         
         Args:
             symbol: Stock symbol (None for all stocks)
             days: Number of days to retrieve
+            symbols: Restrict to these stock symbols (for batched loads)
         """
-        query = self.db.query(MarketData).join(Stock)
+        # Project only the needed columns so rows don't hydrate ORM objects
+        query = self.db.query(
+            Stock.symbol,
+            MarketData.date,
+            MarketData.open,
+            MarketData.high,
+            MarketData.low,
+            MarketData.close,
+            MarketData.volume
+        ).select_from(MarketData).join(Stock, MarketData.stock_id == Stock.id)
         
         if symbol:
             query = query.filter(Stock.symbol == symbol)
+        if symbols is not None:
+            query = query.filter(Stock.symbol.in_(symbols))
         
         # Filter by date
         cutoff_date = datetime.now().date() - timedelta(days=days)
@@ -120,81 +141,130 @@ class DatabaseService:
         # Order by date
         query = query.order_by(Stock.symbol, MarketData.date)
         
-        # Convert to DataFrame
-        data = []
-        for record in query.all():
-            data.append({
-                'symbol': record.stock.symbol,
-                'Date': record.date,
-                'Open': float(record.open) if record.open else None,
-                'High': float(record.high) if record.high else None,
-                'Low': float(record.low) if record.low else None,
-                'Close': float(record.close) if record.close else None,
-                'Volume': int(record.volume) if record.volume else None,
-            })
+        # Convert to DataFrame column-wise
+        df = pd.DataFrame(
+            query.all(),
+            columns=['symbol', 'Date', 'Open', 'High', 'Low', 'Close', 'Volume']
+        )
         
-        return pd.DataFrame(data)
+        price_cols = ['Open', 'High', 'Low', 'Close']
+        df[price_cols] = df[price_cols].apply(pd.to_numeric).astype(float)
+        df['Volume'] = pd.to_numeric(df['Volume'])
+        
+        # Zero values are treated as missing, as before
+        numeric_cols = price_cols + ['Volume']
+        df[numeric_cols] = df[numeric_cols].mask(df[numeric_cols] == 0)
+        
+        return df
+    
+    def get_market_data_symbols(self, days: int = 365) -> List[str]:
+        """Get symbols that have market data in the last `days` days"""
+        cutoff_date = datetime.now().date() - timedelta(days=days)
+        
+        query = (
+            self.db.query(Stock.symbol)
+            .select_from(MarketData)
+            .join(Stock, MarketData.stock_id == Stock.id)
+            .filter(MarketData.date >= cutoff_date)
+            .distinct()
+            .order_by(Stock.symbol)
+        )
+        
+        return [symbol for (symbol,) in query.all()]
+    
+    def get_market_average(self, days: int = 365) -> pd.DataFrame:
+        """Get mean close and total volume across all stocks per day, aggregated in the database"""
+        cutoff_date = datetime.now().date() - timedelta(days=days)
+        
+        query = (
+            self.db.query(
+                MarketData.date,
+                func.avg(MarketData.close).label('close'),
+                func.sum(MarketData.volume).label('volume')
+            )
+            .filter(MarketData.date >= cutoff_date)
+            .group_by(MarketData.date)
+            .order_by(MarketData.date)
+        )
+        
+        df = pd.DataFrame(query.all(), columns=['Date', 'Close', 'Volume'])
+        df['Close'] = pd.to_numeric(df['Close']).astype(float)
+        df['Volume'] = pd.to_numeric(df['Volume'])
+        
+        return df
     
     # ==================== RISK SCORE OPERATIONS ====================
     
     def save_risk_scores(self, data: pd.DataFrame, upsert: bool = True):
-        """Save risk scores to database"""
+        """Save risk scores to database with a single batched upsert"""
         log.info(f"Saving {len(data)} risk score records to database...")
         
-        saved_count = 0
-        updated_count = 0
+        stock_ids = self.get_stock_id_map(data['symbol'].tolist())
         
-        for _, row in data.iterrows():
-            stock = self.get_stock_by_symbol(row['symbol'])
-            if not stock:
+        def number(record, column, cast=float):
+            value = record.get(column)
+            return cast(value) if pd.notna(value) else None
+        
+        # One row per (stock, date), a later duplicate replacing an earlier one
+        rows = {}
+        for record in data.to_dict('records'):
+            stock_id = stock_ids.get(record['symbol'])
+            if not stock_id:
                 continue
             
-            record_date = row['Date'].date() if hasattr(row['Date'], 'date') else row['Date']
-            
-            # Check if record exists
-            existing = self.db.query(RiskScore).filter(
-                RiskScore.stock_id == stock.id,
-                RiskScore.date == record_date
-            ).first()
-            
-            if existing and upsert:
-                # Update existing
-                existing.risk_score = float(row['risk_score']) if pd.notna(row.get('risk_score')) else None
-                existing.risk_level = row.get('risk_level')
-                existing.risk_rank = int(row['risk_rank']) if pd.notna(row.get('risk_rank')) else None
-                existing.volatility_21d = float(row.get('volatility_21d', 0)) if pd.notna(row.get('volatility_21d')) else None
-                existing.max_drawdown = float(row.get('max_drawdown', 0)) if pd.notna(row.get('max_drawdown')) else None
-                existing.risk_drivers = row.get('risk_drivers')
-                updated_count += 1
-            elif not existing:
-                # Insert new
-                risk_score = RiskScore(
-                    stock_id=stock.id,
-                    date=record_date,
-                    risk_score=float(row['risk_score']) if pd.notna(row.get('risk_score')) else None,
-                    risk_level=row.get('risk_level'),
-                    risk_rank=int(row['risk_rank']) if pd.notna(row.get('risk_rank')) else None,
-                    volatility_21d=float(row.get('volatility_21d', 0)) if pd.notna(row.get('volatility_21d')) else None,
-                    volatility_60d=float(row.get('volatility_60d', 0)) if pd.notna(row.get('volatility_60d')) else None,
-                    max_drawdown=float(row.get('max_drawdown', 0)) if pd.notna(row.get('max_drawdown')) else None,
-                    beta=float(row.get('beta', 0)) if pd.notna(row.get('beta')) else None,
-                    sharpe_ratio=float(row.get('sharpe_ratio', 0)) if pd.notna(row.get('sharpe_ratio')) else None,
-                    atr_pct=float(row.get('atr_pct', 0)) if pd.notna(row.get('atr_pct')) else None,
-                    liquidity_risk=float(row.get('liquidity_risk', 0)) if pd.notna(row.get('liquidity_risk')) else None,
-                    norm_volatility=float(row.get('norm_volatility', 0)) if pd.notna(row.get('norm_volatility')) else None,
-                    norm_drawdown=float(row.get('norm_drawdown', 0)) if pd.notna(row.get('norm_drawdown')) else None,
-                    norm_sentiment=float(row.get('norm_sentiment', 0)) if pd.notna(row.get('norm_sentiment')) else None,
-                    norm_liquidity=float(row.get('norm_liquidity', 0)) if pd.notna(row.get('norm_liquidity')) else None,
-                    risk_drivers=row.get('risk_drivers'),
+            record_date = record['Date'].date() if hasattr(record['Date'], 'date') else record['Date']
+            rows[(stock_id, record_date)] = {
+                'stock_id': stock_id,
+                'date': record_date,
+                'risk_score': number(record, 'risk_score'),
+                'risk_level': record.get('risk_level'),
+                'risk_rank': number(record, 'risk_rank', int),
+                'volatility_21d': number(record, 'volatility_21d'),
+                'volatility_60d': number(record, 'volatility_60d'),
+                'max_drawdown': number(record, 'max_drawdown'),
+                'beta': number(record, 'beta'),
+                'sharpe_ratio': number(record, 'sharpe_ratio'),
+                'atr_pct': number(record, 'atr_pct'),
+                'liquidity_risk': number(record, 'liquidity_risk'),
+                'norm_volatility': number(record, 'norm_volatility'),
+                'norm_drawdown': number(record, 'norm_drawdown'),
+                'norm_sentiment': number(record, 'norm_sentiment'),
+                'norm_liquidity': number(record, 'norm_liquidity'),
+                'risk_drivers': record.get('risk_drivers'),
+            }
+        
+        if rows:
+            # INSERT ... ON CONFLICT on (stock_id, date); existing rows only
+            # get the score columns refreshed, as before
+            stmt = pg_insert(RiskScore)
+            if upsert:
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=['stock_id', 'date'],
+                    set_={
+                        column: stmt.excluded[column]
+                        for column in ('risk_score', 'risk_level', 'risk_rank',
+                                       'volatility_21d', 'max_drawdown', 'risk_drivers')
+                    }
                 )
-                self.db.add(risk_score)
-                saved_count += 1
+            else:
+                stmt = stmt.on_conflict_do_nothing(index_elements=['stock_id', 'date'])
+            
+            self.db.execute(stmt, list(rows.values()))
         
         self.db.commit()
-        log.info(f"✓ Saved {saved_count} new records, updated {updated_count} records")
+        log.info(f"✓ Saved {len(rows)} risk score records")
     
-    def get_latest_risk_scores(self) -> pd.DataFrame:
-        """Get latest risk scores for all stocks with sentiment data"""
+    def has_risk_scores(self) -> bool:
+        """Check whether any risk score has been saved (EXISTS query)"""
+        return self.db.query(self.db.query(RiskScore.id).exists()).scalar()
+    
+    def get_latest_risk_scores(self, risk_level: str = None) -> pd.DataFrame:
+        """
+        Get latest risk scores for all stocks with sentiment data
+        
+        Args:
+            risk_level: Only return stocks at this risk level (filtered in SQL)
+        """
         from datetime import datetime, timedelta
         
         # Subquery to get latest date for each stock
@@ -242,9 +312,13 @@ class DatabaseService:
                 sentiment_subquery,
                 RiskScore.stock_id == sentiment_subquery.c.stock_id
             )
-            .order_by(RiskScore.risk_rank)
         )
         
+        if risk_level:
+            query = query.filter(RiskScore.risk_level == risk_level)
+        
+        query = query.order_by(RiskScore.risk_rank)
+        
         # Convert to DataFrame
         data = []
         for row in query.all():
@@ -311,53 +385,61 @@ class DatabaseService:
         """Get recent sentiment scores"""
         cutoff_date = datetime.now().date() - timedelta(days=days)
         
-        query = self.db.query(SentimentScore).join(Stock).filter(
+        # Project only the needed columns so rows don't hydrate ORM objects
+        query = self.db.query(
+            Stock.symbol,
+            SentimentScore.date,
+            SentimentScore.avg_sentiment,
+            SentimentScore.sentiment_std,
+            SentimentScore.article_count
+        ).select_from(SentimentScore).join(Stock, SentimentScore.stock_id == Stock.id).filter(
             SentimentScore.date >= cutoff_date
         )
         
-        data = []
-        for record in query.all():
-            data.append({
-                'stock_symbol': record.stock.symbol,
-                'date': record.date,
-                'avg_sentiment': float(record.avg_sentiment) if record.avg_sentiment else 0,
-                'sentiment_std': float(record.sentiment_std) if record.sentiment_std else 0,
-                'article_count': record.article_count,
-            })
+        df = pd.DataFrame(
+            query.all(),
+            columns=['stock_symbol', 'date', 'avg_sentiment', 'sentiment_std', 'article_count']
+        )
         
-        return pd.DataFrame(data)
+        # Missing scores read as 0, as before
+        score_cols = ['avg_sentiment', 'sentiment_std']
+        df[score_cols] = df[score_cols].apply(pd.to_numeric).fillna(0).astype(float)
+        
+        return df
     
     # ==================== ALERT OPERATIONS ====================
     
     def save_alerts(self, alerts: List[Dict]):
-        """Save alerts to database"""
+        """Save alerts to database with a single batched INSERT"""
         log.info(f"Saving {len(alerts)} alerts to database...")
         
-        saved_count = 0
-        
-        for alert_data in alerts:
-            stock = self.get_stock_by_symbol(alert_data['symbol'])
-            if not stock:
-                continue
-            
-            alert = Alert(
-                stock_id=stock.id,
-                alert_type=alert_data.get('alert_type'),
-                severity=alert_data.get('severity'),
-                risk_score=float(alert_data.get('risk_score', 0)) if alert_data.get('risk_score') else None,
-                prev_risk_score=float(alert_data.get('prev_risk_score', 0)) if alert_data.get('prev_risk_score') else None,
-                risk_change=float(alert_data.get('risk_change', 0)) if alert_data.get('risk_change') else None,
-                risk_change_pct=float(alert_data.get('risk_change_pct', 0)) if alert_data.get('risk_change_pct') else None,
-                risk_level=alert_data.get('risk_level'),
-                risk_drivers=alert_data.get('risk_drivers'),
-                explanation=alert_data.get('explanation'),
-                created_at=alert_data.get('timestamp', datetime.utcnow()),
-            )
-            self.db.add(alert)
-            saved_count += 1
+        stock_ids = self.get_stock_id_map([a['symbol'] for a in alerts])
+        now = datetime.utcnow()
+        
+        rows = [
+            {
+                'stock_id': stock_ids[alert_data['symbol']],
+                'alert_type': alert_data.get('alert_type'),
+                'severity': alert_data.get('severity'),
+                'risk_score': float(alert_data.get('risk_score', 0)) if alert_data.get('risk_score') else None,
+                'prev_risk_score': float(alert_data.get('prev_risk_score', 0)) if alert_data.get('prev_risk_score') else None,
+                'risk_change': float(alert_data.get('risk_change', 0)) if alert_data.get('risk_change') else None,
+                'risk_change_pct': float(alert_data.get('risk_change_pct', 0)) if alert_data.get('risk_change_pct') else None,
+                'risk_level': alert_data.get('risk_level'),
+                'risk_drivers': alert_data.get('risk_drivers'),
+                'explanation': alert_data.get('explanation'),
+                'created_at': alert_data.get('timestamp', now),
+            }
+            for alert_data in alerts
+            if stock_ids.get(alert_data['symbol'])
+        ]
+        
+        if rows:
+            # Executemany is batched into multi-row VALUES by SQLAlchemy
+            self.db.execute(insert(Alert), rows)
         
         self.db.commit()
-        log.info(f"✓ Saved {saved_count} alerts")
+        log.info(f"✓ Saved {len(rows)} alerts")
     
     def get_recent_alerts(self, limit: int = 100) -> List[Dict]:
         """Get recent alerts"""
@@ -386,28 +468,38 @@ class DatabaseService:
     # ==================== RISK HISTORY OPERATIONS ====================
     
     def save_risk_history(self, data: pd.DataFrame):
-        """Save risk history"""
+        """Save risk history (append-only batched INSERT)"""
         log.info(f"Saving {len(data)} risk history records...")
         
-        for _, row in data.iterrows():
-            stock = self.get_stock_by_symbol(row['symbol'])
-            if not stock:
-                continue
-            
-            risk_history = RiskHistory(
-                stock_id=stock.id,
-                risk_score=float(row['risk_score']) if pd.notna(row['risk_score']) else None,
-                risk_level=row.get('risk_level'),
-                timestamp=datetime.utcnow(),
-            )
-            self.db.add(risk_history)
+        stock_ids = self.get_stock_id_map(data['symbol'].tolist())
+        timestamp = datetime.utcnow()
+        
+        rows = [
+            {
+                'stock_id': stock_ids[record['symbol']],
+                'risk_score': float(record['risk_score']) if pd.notna(record['risk_score']) else None,
+                'risk_level': record.get('risk_level'),
+                'timestamp': timestamp,
+            }
+            for record in data.to_dict('records')
+            if stock_ids.get(record['symbol'])
+        ]
+        
+        if rows:
+            self.db.execute(insert(RiskHistory), rows)
         
         self.db.commit()
         log.info(f"✓ Saved risk history")
     
     def get_risk_history(self, symbol: str = None, days: int = 30) -> pd.DataFrame:
         """Get risk history"""
-        query = self.db.query(RiskHistory).join(Stock)
+        # Project only the needed columns so rows don't hydrate ORM objects
+        query = self.db.query(
+            Stock.symbol,
+            RiskHistory.risk_score,
+            RiskHistory.risk_level,
+            RiskHistory.timestamp
+        ).select_from(RiskHistory).join(Stock, RiskHistory.stock_id == Stock.id)
         
         if symbol:
             query = query.filter(Stock.symbol == symbol)
@@ -416,16 +508,35 @@ class DatabaseService:
         query = query.filter(RiskHistory.timestamp >= cutoff_date)
         query = query.order_by(RiskHistory.timestamp)
         
-        data = []
-        for record in query.all():
-            data.append({
-                'symbol': record.stock.symbol,
-                'risk_score': float(record.risk_score) if record.risk_score else None,
-                'risk_level': record.risk_level,
-                'timestamp': record.timestamp,
-            })
+        df = pd.DataFrame(
+            query.all(),
+            columns=['symbol', 'risk_score', 'risk_level', 'timestamp']
+        )
+        df['risk_score'] = pd.to_numeric(df['risk_score']).astype(float)
+        # Few distinct symbols across many rows: categorical keys hash and group faster
+        df['symbol'] = df['symbol'].astype('category')
         
-        return pd.DataFrame(data)
+        return df
+    
+    def get_average_risk_history(self, days: int = 30) -> pd.DataFrame:
+        """Get average historical risk score per stock, aggregated in the database"""
+        cutoff_date = datetime.now() - timedelta(days=days)
+        
+        query = (
+            self.db.query(
+                Stock.symbol,
+                func.avg(RiskHistory.risk_score).label('prev_risk_score')
+            )
+            .select_from(RiskHistory)
+            .join(Stock, RiskHistory.stock_id == Stock.id)
+            .filter(RiskHistory.timestamp >= cutoff_date)
+            .group_by(Stock.symbol)
+        )
+        
+        df = pd.DataFrame(query.all(), columns=['symbol', 'prev_risk_score'])
+        df['prev_risk_score'] = pd.to_numeric(df['prev_risk_score']).astype(float)
+        
+        return df
     
     def get_market_data_with_features(self, symbol: str, days: int = 90) -> pd.DataFrame:
         """Get market data with computed features for charting"""
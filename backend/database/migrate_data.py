@@ -219,8 +219,8 @@ class DataMigration:
             df = pd.read_csv(filepath)
             log.info(f"Loaded {len(df)} rows from {filepath}")
             
-            # Convert date
-            df['date'] = pd.to_datetime(df['date'])
+            # Convert date (ISO-8601 in the CSV export, so skip format inference)
+            df['date'] = pd.to_datetime(df['date'], format='ISO8601')
             
             with tqdm(total=len(df), desc="Sentiment Scores") as pbar:
                 for _, row in df.iterrows():
@@ -217,6 +217,7 @@ class RiskScore(Base):
     __table_args__ = (
         UniqueConstraint('stock_id', 'date', name='uix_risk_stock_date'),
         Index('idx_risk_scores_stock_date', 'stock_id', 'date'),
+        Index('idx_risk_scores_level_date', 'risk_level', 'date'),
     )
 
 
@@ -265,6 +266,7 @@ class SentimentScore(Base):
     __table_args__ = (
         UniqueConstraint('stock_id', 'date', name='uix_sentiment_stock_date'),
         Index('idx_sentiment_stock_date', 'stock_id', 'date'),
+        Index('idx_sentiment_date', 'date'),
     )
 
 
@@ -173,8 +173,10 @@ CREATE TABLE risk_history (
 -- Create indexes for performance
 CREATE INDEX idx_market_data_stock_date ON market_data(stock_id, date DESC);
 CREATE INDEX idx_risk_scores_stock_date ON risk_scores(stock_id, date DESC);
+CREATE INDEX idx_risk_scores_level_date ON risk_scores(risk_level, date DESC);
 CREATE INDEX idx_news_stock_date ON news_articles(stock_id, published_date DESC);
 CREATE INDEX idx_sentiment_stock_date ON sentiment_scores(stock_id, date DESC);
+CREATE INDEX idx_sentiment_date ON sentiment_scores(date DESC);
 CREATE INDEX idx_alerts_created ON alerts(created_at DESC);
 CREATE INDEX idx_alerts_stock ON alerts(stock_id);
 CREATE INDEX idx_risk_history_stock_time ON risk_history(stock_id, timestamp DESC);
\ No newline at end of file
@@ -2,6 +2,7 @@
 Main Pipeline - Orchestrate all agents with PostgreSQL
 """
 import sys
+import pandas as pd
 from backend.utils import log, load_config
 from backend.database import DatabaseService
 from backend.agents.market_agent import MarketDataAgent
@@ -101,24 +102,24 @@ def step_4_build_rag_knowledge_base():
                 log.warning("No news articles found in database")
                 return True  # Not a critical error
             
-            # Convert to documents
-            documents = []
+            # Convert to texts and metadata
+            texts = []
+            metadata = []
             for article in news_query:
-                doc_text = f"{article.headline}\n{article.description or ''}"
-                metadata = {
+                texts.append(f"{article.headline}\n{article.description or ''}")
+                metadata.append({
                     'source': article.source or 'Unknown',
                     'stock_symbol': article.stock.symbol if article.stock else 'GENERAL',
                     'date': article.published_date.isoformat() if article.published_date else '',
                     'sentiment': article.sentiment_label or 'neutral',
                     'url': article.url or ''
-                }
-                documents.append({'text': doc_text, 'metadata': metadata})
+                })
             
-            log.info(f"Loaded {len(documents)} news articles")
+            log.info(f"Loaded {len(texts)} news articles")
         
         # Build vector store
-        if documents:
-            vector_store = agent.build_vector_store(documents)
+        if texts:
+            vector_store = agent.build_vector_store(texts, pd.DataFrame(metadata))
             
             if vector_store:
                 agent.save_vector_store(vector_store)
@@ -8,7 +8,6 @@ Scrapes full article content from each URL via requests + BeautifulSoup.
 import yfinance as yf
 import requests
 import time
-import re
 from datetime import datetime
 from bs4 import BeautifulSoup
 from backend.utils import log
@@ -82,7 +81,8 @@ class NewsFetcher:
                         if len(p.get_text(strip=True)) > 40
                     )
 
-            content = re.sub(r'\s+', ' ', content).strip()
+            # Collapse whitespace (str.split is much faster than a regex here)
+            content = ' '.join(content.split())
 
             # Truncate very long articles
             if len(content) > 5000:
@@ -13,7 +13,6 @@ from datetime import datetime
 import time
 from typing import List, Dict, Optional
 from backend.utils import log
-import re
 
 class SeleniumNewsScraper:
     """
@@ -213,8 +212,8 @@ class SeleniumNewsScraper:
                 return None
             
             # Clean
-            headline = re.sub(r'\s+', ' ', headline).strip()
-            content = re.sub(r'\s+', ' ', content).strip()
+            headline = ' '.join(headline.split())
+            content = ' '.join(content.split())
             
             return {
                 'headline': headline,
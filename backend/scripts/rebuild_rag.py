@@ -5,13 +5,13 @@ backend/scripts/rebuild_rag.py
 Usage: python -m backend.scripts.rebuild_rag
 """
 import sys, os
+import pandas as pd
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
 
 from backend.agents.rag_agent import NewsRAGAgent
 from backend.database import DatabaseService
 from backend.database.models import NewsArticle, Stock
 from backend.utils import log
-from langchain.schema import Document
 
 def main():
     log.info("Rebuilding RAG vector store from real news articles...")
@@ -26,7 +26,8 @@ def main():
             log.error("No articles found! Run news fetcher first.")
             return
 
-        documents = []
+        texts = []
+        metadata = []
         for article in news_query:
             headline = article.headline or ""
             description = article.description or ""
@@ -38,22 +39,19 @@ def main():
             else:
                 doc_text = headline + "\n" + description
 
-            metadata = {
+            texts.append(doc_text)
+            metadata.append({
                 "source": article.source or "Unknown",
                 "stock_symbol": article.stock.symbol if article.stock else "GENERAL",
                 "date": str(article.published_date) if article.published_date else "",
                 "sentiment": article.sentiment_label or "neutral",
                 "url": article.url or "",
-            }
-            documents.append(Document(
-                page_content=doc_text,
-                metadata=metadata,
-            ))
+            })
 
-        log.info(f"Built {len(documents)} documents for vector store")
+        log.info(f"Built {len(texts)} documents for vector store")
 
     # Build vector store
-    vector_store = agent.build_vector_store(documents)
+    vector_store = agent.build_vector_store(texts, pd.DataFrame(metadata))
 
     if vector_store:
         agent.save_vector_store(vector_store)
@@ -23,6 +23,7 @@ class GroqLLM:
         self.model = model
         self.temperature = temperature
         self.base_url = "https://api.groq.com/openai/v1/chat/completions"
+        self.models_url = "https://api.groq.com/openai/v1/models"
 
         if not self.api_key:
             raise ValueError(
@@ -32,18 +33,41 @@ class GroqLLM:
 
         log.info(f"✓ Groq LLM initialized (model: {self.model})")
 
-    def _build_messages(self, prompt):
-        """Convert a single prompt string into chat messages format."""
-        return [{"role": "user", "content": prompt}]
+    def is_available(self, timeout=1.0):
+        """
+        Check the API is reachable and the key is accepted, without generating.
+        Lists the available models (one cheap GET) instead of running a completion.
+        """
+        try:
+            resp = requests.get(
+                self.models_url,
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                timeout=timeout,
+            )
+            if resp.status_code != 200:
+                log.warning(f"Groq models endpoint returned {resp.status_code}")
+                return False
+            return True
+        except Exception as e:
+            log.warning(f"Groq not reachable: {e}")
+            return False
 
-    def invoke(self, prompt):
+    def _build_messages(self, prompt, system=None):
+        """Convert a prompt string (and optional system prompt) into chat messages format."""
+        messages = [{"role": "user", "content": prompt}]
+        if system:
+            messages.insert(0, {"role": "system", "content": system})
+        return messages
+
+    def invoke(self, prompt, system=None):
         """
         Generate a complete response (non-streaming).
         Compatible with LangChain's llm.invoke(prompt) interface.
+        An optional system prompt is sent as a separate system message.
         """
         payload = {
             "model": self.model,
-            "messages": self._build_messages(prompt),
+            "messages": self._build_messages(prompt, system),
             "temperature": self.temperature,
             "max_tokens": 1024,
             "stream": False,
@@ -80,7 +104,18 @@ class GroqLLM:
             log.error(f"Groq invoke error: {e}")
             return f"Error: {str(e)}"
 
-    def stream(self, prompt):
+    def batch(self, prompts, max_workers=4, system=None):
+        """
+        Generate complete responses for several prompts concurrently.
+        Compatible with LangChain's llm.batch(prompts) interface.
+        Returns responses in prompt order.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(lambda prompt: self.invoke(prompt, system), prompts))
+
+    def stream(self, prompt, system=None):
         """
         Generate a streaming response (token by token).
         Compatible with LangChain's llm.stream(prompt) interface.
@@ -88,7 +123,7 @@ class GroqLLM:
         """
         payload = {
             "model": self.model,
-            "messages": self._build_messages(prompt),
+            "messages": self._build_messages(prompt, system),
             "temperature": self.temperature,
             "max_tokens": 1024,
             "stream": True,
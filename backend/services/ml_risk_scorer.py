@@ -254,8 +254,9 @@ class MLRiskScorer:
             featured['spy_return_21d'] = 0.0
             featured['high_vol_regime'] = 0
 
-        # Get latest features per stock
-        latest = featured.sort_values('date').groupby('symbol_col').last()
+        # Get latest features per stock (each stock's rows are already in date
+        # order from compute_features, so no global sort is needed)
+        latest = featured.groupby('symbol_col').last()
 
         # Check which features are available
         available_features = [f for f in self.feature_cols if f in latest.columns]
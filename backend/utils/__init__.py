@@ -2,7 +2,7 @@
 Utilities module
 """
 from backend.utils.logger import log
-from backend.utils.config_loader import load_config, get_stock_symbols, get_data_sources
+from backend.utils.config_loader import load_config, reload_config, get_stock_symbols, get_data_sources
 from backend.utils.helpers import (
     ensure_dir,
     get_date_range,
@@ -10,15 +10,18 @@ from backend.utils.helpers import (
     load_dataframe,
     normalize_score
 )
+from backend.utils.cache import TTLCache
 
 __all__ = [
     'log',
     'load_config',
+    'reload_config',
     'get_stock_symbols',
     'get_data_sources',
     'ensure_dir',
     'get_date_range',
     'save_dataframe',
     'load_dataframe',
-    'normalize_score'
+    'normalize_score',
+    'TTLCache'
 ]
\ No newline at end of file
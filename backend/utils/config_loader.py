@@ -1,29 +1,51 @@
 """
 Configuration loader utility
 """
+import copy
 import yaml
+from functools import lru_cache
 from pathlib import Path
 from typing import Dict, Any
 
+@lru_cache(maxsize=8)
+def _read_config(config_path: str) -> Dict[str, Any]:
+    """Read and parse a YAML config file (memoized per path)"""
+    config_file = Path(config_path)
+    
+    if not config_file.exists():
+        raise FileNotFoundError(f"Config file not found: {config_path}")
+    
+    with open(config_file, 'r') as f:
+        return yaml.safe_load(f)
+
 def load_config(config_path: str = "backend/configs/config.yaml") -> Dict[str, Any]:
     """
     Load configuration from YAML file
     
+    The file is parsed once per process; each call returns a private copy
+    so callers can't mutate the cached config. Use reload_config() to pick
+    up changes on disk.
+    
     Args:
         config_path: Path to config file
         
     Returns:
         Configuration dictionary
     """
-    config_file = Path(config_path)
-    
-    if not config_file.exists():
-        raise FileNotFoundError(f"Config file not found: {config_path}")
-    
-    with open(config_file, 'r') as f:
-        config = yaml.safe_load(f)
+    return copy.deepcopy(_read_config(config_path))
+
+def reload_config(config_path: str = "backend/configs/config.yaml") -> Dict[str, Any]:
+    """
+    Drop the cached configuration and load it again from disk
     
-    return config
+    Args:
+        config_path: Path to config file
+        
+    Returns:
+        Configuration dictionary
+    """
+    _read_config.cache_clear()
+    return load_config(config_path)
 
 def get_stock_symbols() -> list:
     """
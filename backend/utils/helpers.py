@@ -7,6 +7,13 @@ from typing import List
 import pandas as pd
 from datetime import datetime, timedelta
 
+# pyarrow's multithreaded CSV writer (optional, pandas' writer otherwise)
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
+
 def ensure_dir(directory: str) -> Path:
     """
     Create directory if it doesn't exist
@@ -49,10 +56,29 @@ def save_dataframe(df: pd.DataFrame, filepath: str, format: str = 'parquet'):
     if format == 'parquet':
         df.to_parquet(filepath, index=False)
     elif format == 'csv':
-        df.to_csv(filepath, index=False)
+        _write_csv(df, filepath)
     else:
         raise ValueError(f"Unsupported format: {format}")
 
+def _write_csv(df: pd.DataFrame, filepath: str):
+    """
+    Write dataframe as CSV, through pyarrow when it is installed
+    
+    Frames pyarrow cannot convert (e.g. mixed-type object columns) go
+    through pandas' writer instead.
+    """
+    if pa is not None:
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            table = None
+        
+        if table is not None:
+            pa_csv.write_csv(table, filepath, write_options=pa_csv.WriteOptions(include_header=True))
+            return
+    
+    df.to_csv(filepath, index=False)
+
 def load_dataframe(filepath: str, format: str = 'parquet') -> pd.DataFrame:
     """
     Load dataframe from file